@@ -0,0 +1,304 @@
+import argparse
+import can
+import json
+import logging
+import random
+import struct
+import sys
+import time
+from bmslistener import BMSListener
+from collections import defaultdict
+from ewa import Ewa
+from threading import Thread
+
+# samples both runs need before their p50 and p99 latencies are compared
+MIN_SAMPLES = 20
+MIN_P99_SAMPLES = 1000
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+class Probe(object):
+    """
+    Collects the latency of every signal from the moment the synthetic source created a sample until it reached the
+    display.
+    """
+
+    def __init__(self):
+        self.stamp = 0.
+        self.latencies = defaultdict(list)
+
+    def arrived(self, signal, stamp=None):
+        self.latencies[signal].append(time.time() - (self.stamp if stamp is None else stamp))
+
+    def results(self, duration):
+        signals = {}
+        for signal, latencies in sorted(self.latencies.items()):
+            signals[signal] = {'count': len(latencies), 'rate': len(latencies) / duration,
+                               'p50': percentile(latencies, .5), 'p99': percentile(latencies, .99),
+                               'max': max(latencies)}
+        return signals
+
+
+class HeadlessDisplay(object):
+    """
+    Receives the values instead of the DisplayApp when running without UI. Controller and battery both set the
+    voltage, each gets its own instance recording it under its own signal.
+    """
+
+    def __init__(self, probe, voltage='voltage'):
+        self._probe = probe
+        self._voltage = voltage
+
+    def connected(self, connected):
+        pass
+
+    def set_measure(self, value, timestamp=None):
+        self._probe.arrived('measure')
+
+    def set_torque(self, value, timestamp=None):
+        self._probe.arrived('torque')
+
+    def set_force(self, measure, torque, timestamp=None):
+        self._probe.arrived('measure')
+        self._probe.arrived('torque')
+
+    def set_rpm(self, value, timestamp=None):
+        self._probe.arrived('rpm')
+
+    def set_rope_speed(self, value, timestamp=None):
+        self._probe.arrived('rope_speed')
+
+    def set_speed(self, rpm, rope_speed, timestamp=None):
+        self._probe.arrived('rpm')
+        self._probe.arrived('rope_speed')
+
+    def set_motor_temperature(self, value, timestamp=None):
+        self._probe.arrived('motor_temperature')
+
+    def set_controller_temperature(self, value, timestamp=None):
+        self._probe.arrived('controller_temperature')
+
+    def set_voltage(self, value, timestamp=None):
+        self._probe.arrived(self._voltage)
+
+    def set_charge_level(self, value, timestamp=None):
+        self._probe.arrived('charge_level')
+
+    def set_min_cell_address_voltage(self, address, voltage, timestamp=None):
+        self._probe.arrived('min_cell')
+
+    def set_cells(self, summary, timestamp=None):
+        self._probe.arrived('cells')
+
+
+def measured_display(probe, mapping, latency):
+    """
+    A DisplayApp that additionally measures when the fast values are drawn by its update() Clock callback.
+    """
+    from display import DisplayApp
+
+    class MeasuredDisplayApp(DisplayApp):
+        kv_file = 'display.kv'
+        _FIELDS = ('measure', 'torque', 'rpm', 'rope_speed')
+
+        def __init__(self):
+            super(MeasuredDisplayApp, self).__init__(True, mapping, latency)
+            self._probe_stamps = {}
+            self._pending = []
+
+        def set_measure(self, value, timestamp=None):
+            self._probe_stamps['measure'] = probe.stamp
+            super(MeasuredDisplayApp, self).set_measure(value, timestamp)
+
+        def set_torque(self, value, timestamp=None):
+            self._probe_stamps['torque'] = probe.stamp
+            super(MeasuredDisplayApp, self).set_torque(value, timestamp)
+
+        def set_force(self, measure, torque, timestamp=None):
+            self._probe_stamps['measure'] = probe.stamp
+            self._probe_stamps['torque'] = probe.stamp
+            super(MeasuredDisplayApp, self).set_force(measure, torque, timestamp)
+
+        def set_rpm(self, value, timestamp=None):
+            self._probe_stamps['rpm'] = probe.stamp
+            super(MeasuredDisplayApp, self).set_rpm(value, timestamp)
+
+        def set_rope_speed(self, value, timestamp=None):
+            self._probe_stamps['rope_speed'] = probe.stamp
+            super(MeasuredDisplayApp, self).set_rope_speed(value, timestamp)
+
+        def set_speed(self, rpm, rope_speed, timestamp=None):
+            self._probe_stamps['rpm'] = probe.stamp
+            self._probe_stamps['rope_speed'] = probe.stamp
+            super(MeasuredDisplayApp, self).set_speed(rpm, rope_speed, timestamp)
+
+        def refresh(self):
+            frame = super(MeasuredDisplayApp, self).refresh()
+            self._pending = [field for field in self._FIELDS if field in self._changed]
+            return frame
+
+        def update(self):
+            super(MeasuredDisplayApp, self).update()
+            # fields of screens not created yet stay marked
+            for field in self._pending:
+                if field not in self._changed:
+                    probe.arrived('drawn ' + field, self._probe_stamps[field])
+
+    return MeasuredDisplayApp()
+
+
+def battery_frames():
+    """
+    One cycle of scripts/battery.sh.
+    """
+    frames = [(0x137, struct.pack('>3H2B', random.randint(7800, 10650), random.randint(1, 500), 100, 0, 0)),
+              (0x138, struct.pack('>HBH3B', random.randint(260, 355), 3, random.randint(260, 355), 17, 0, 30)),
+              (0x139, struct.pack('8B', 20, 30, 10, 0, 0, 0, 4, 9)),
+              (0x13a, struct.pack('>4H', 0, 2000, 600, random.randint(0, 1000)))]
+    frames += [(0x13b, struct.pack('>BHB', i, random.randint(260, 355), 25)) for i in range(1, 31)]
+    return frames
+
+
+class Source(object):
+    """
+    Synthetic frame source driving the real acquisition path of Ewa and the BMSListener. rate is the frequency of
+    throttle and RPM samples, 0 sends them as fast as possible. Temperatures and voltage come once a second, a full
+    BMS cycle bms_rate times a second.
+    """
+
+    def __init__(self, ewa, bms, probe, rate, bms_rate):
+        self._ewa = ewa
+        self._bms = bms
+        self._probe = probe
+        self._tasks = [[1. / rate if rate > 0 else 0., self.fast], [1., self.slow]]
+        if bms_rate > 0:
+            self._tasks.append([1. / bms_rate, self.battery])
+        self.run = True
+
+    def fast(self):
+        self._probe.stamp = time.time()
+        self._ewa.show_data(random.randint(0, 15000))
+        self._probe.stamp = time.time()
+        self._ewa.show_rpm(random.randint(0, 5000))
+
+    def slow(self):
+        self._probe.stamp = time.time()
+        self._ewa.show_motor_temperature(random.randint(0, 1000))
+        self._probe.stamp = time.time()
+        self._ewa.show_controller_temperature(random.randint(0, 1000))
+        self._probe.stamp = time.time()
+        self._ewa.show_voltage(random.randint(0, 10000))
+
+    def battery(self):
+        for can_id, data in battery_frames():
+            self._probe.stamp = time.time()
+            self._bms.on_message_received(can.Message(timestamp=self._probe.stamp, arbitration_id=can_id,
+                                                      data=data))
+
+    def loop(self, duration):
+        start = time.time()
+        end = start + duration
+        deadlines = [start] * len(self._tasks)
+        while self.run:
+            now = time.time()
+            if now >= end:
+                break
+            for index, (period, task) in enumerate(self._tasks):
+                if deadlines[index] <= now:
+                    task()
+                    deadlines[index] = max(deadlines[index] + period, now - period)
+            wait = min(min(deadlines), end) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        return time.time() - start
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the regressions of results against baseline, i.e. worse latencies or throughput by more than tolerance.
+    Percentiles of few samples are noise, so p50 is only compared with MIN_SAMPLES and p99 with MIN_P99_SAMPLES in
+    both runs.
+    """
+    regressions = []
+    for signal, old in baseline['signals'].items():
+        new = results['signals'].get(signal)
+        if new is None:
+            regressions.append(signal + ' missing')
+            continue
+        count = min(new['count'], old['count'])
+        if count >= MIN_SAMPLES and new['p50'] > old['p50'] * (1. + tolerance):
+            regressions.append('{:s} p50 {:.3f}ms > {:.3f}ms'.format(signal, new['p50'] * 1000, old['p50'] * 1000))
+        if count >= MIN_P99_SAMPLES and new['p99'] > old['p99'] * (1. + tolerance):
+            regressions.append('{:s} p99 {:.3f}ms > {:.3f}ms'.format(signal, new['p99'] * 1000, old['p99'] * 1000))
+        if new['rate'] < old['rate'] * (1. - tolerance):
+            regressions.append('{:s} rate {:.0f}/s < {:.0f}/s'.format(signal, new['rate'], old['rate']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency benchmark of the path from CAN frames to the display')
+    parser.add_argument('-t', default=10., type=float, help='duration in seconds')
+    parser.add_argument('-r', default=100., type=float, help='throttle and RPM samples per second, 0 for maximum')
+    parser.add_argument('-b', default=1., type=float, help='BMS cycles of 34 frames per second')
+    parser.add_argument('-u', action="store_true", help='run with the Kivy UI and measure until values are drawn')
+    parser.add_argument('-o', help='write the results as JSON into this file')
+    parser.add_argument('-c', help='compare against the JSON results in this file, exit with 1 on regressions')
+    parser.add_argument('--tolerance', default=.25, type=float, help='allowed relative regression')
+    args, left = parser.parse_known_args()
+    sys.argv = sys.argv[:1] + left
+    logging.basicConfig(level=logging.INFO)
+    random.seed(0)
+
+    probe = Probe()
+    ewa = Ewa()
+    if args.u:
+        display = measured_display(probe, ewa._mapping, ewa._latency)
+        battery_display = display
+    else:
+        display = HeadlessDisplay(probe, 'controller_voltage')
+        battery_display = HeadlessDisplay(probe, 'battery_voltage')
+    ewa._display = display
+    source = Source(ewa, BMSListener(battery_display, ewa._telemetry, ewa._liveness), probe, args.r, args.b)
+    if args.u:
+        from kivy.clock import Clock
+        results = {}
+
+        def produce():
+            results['duration'] = source.loop(args.t)
+            Clock.schedule_once(lambda *t: display.stop())
+
+        thread = Thread(target=produce)
+        Clock.schedule_once(lambda *t: thread.start())
+        display.run()
+        source.run = False
+        thread.join()
+        duration = results['duration']
+    else:
+        duration = source.loop(args.t)
+
+    results = {'duration': duration, 'rate': args.r, 'ui': args.u, 'signals': probe.results(duration)}
+    print('{:24s} {:>8s} {:>10s} {:>9s} {:>9s} {:>9s}'.format('signal', 'count', 'per second', 'p50 ms', 'p99 ms',
+                                                               'max ms'))
+    for signal, values in sorted(results['signals'].items()):
+        print('{:24s} {:8d} {:10.1f} {:9.3f} {:9.3f} {:9.3f}'.format(signal, values['count'], values['rate'],
+                                                                     values['p50'] * 1000, values['p99'] * 1000,
+                                                                     values['max'] * 1000))
+    if args.o:
+        with open(args.o, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.c:
+        with open(args.c, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
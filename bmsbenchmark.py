@@ -0,0 +1,117 @@
+import argparse
+import logging
+import random
+import struct
+import sys
+import time
+from bmslistener import BMSListener
+from liveness import Liveness
+from telemetry import Telemetry
+
+
+class NullDisplay(object):
+    def set_voltage(self, value, timestamp=None):
+        pass
+
+    def set_min_cell_address_voltage(self, address, voltage, timestamp=None):
+        pass
+
+    def set_charge_level(self, value, timestamp=None):
+        pass
+
+    def set_cells(self, summary, timestamp=None):
+        pass
+
+
+class LegacyBMSListener(object):
+    """
+    The decoder as it was before the dispatch table, kept for comparison. It is a copy of that code and does not use
+    the handlers of BMSListener, which do more work since then: telemetry, liveness and the cell statistics.
+    """
+    _bms_id = 1
+
+    def __init__(self, display):
+        self._display = display
+
+    def process(self, can_id, data, timestamp):
+        if 310 + self._bms_id == can_id:
+            voltage, current, energy, reserved, defect_cell_count = struct.unpack_from('>3H2B', bytes(data))
+            voltage = voltage / 100.0
+            logging.debug(
+                'Voltage {:3.2f}V, Current {:d}A, Energy {:d}Ah, defect cells {:d}'.format(voltage, current, energy,
+                                                                                           defect_cell_count))
+            self._display.set_voltage(voltage)
+        if 311 + self._bms_id == can_id:
+            min_voltage, min_cell_address, max_voltage, max_cell_address, reserved, cell_count = struct.unpack_from(
+                '>HBH3B', bytes(data))
+            min_voltage /= 100.0
+            max_voltage /= 100.0
+            logging.debug('Minimum Voltage {:1.2f}V cell {:d}, maximum voltage {:1.2f}V cell: {:d}, cells {:d}'.format(
+                min_voltage, min_cell_address, max_voltage, max_cell_address, cell_count))
+            self._display.set_min_cell_address_voltage(min_cell_address, min_voltage)
+        if 312 + self._bms_id == can_id:
+            average_temperature, max_temperature, min_temperature, reserved, reserved, reserved, \
+                min_temp_cell_address, max_temp_cell_address = struct.unpack_from('8B', bytes(data))
+            logging.debug(
+                u'Average temperature {:d}\u00b0C, hottest temperature {:d}\u00b0C cell {:d}, coldest temperature '
+                u'{:d}\u00b0C, cell {:d}'.format(average_temperature, max_temperature, max_temp_cell_address,
+                                                 min_temperature, min_temp_cell_address))
+        if 313 + self._bms_id == can_id:
+            low_limit, current_limit, capacity, charge_level = struct.unpack_from('>4H', bytes(data))
+            capacity /= 10.0
+            charge_level /= 10.0
+            logging.debug('Capacity {:3.1f}Ah, Charge level {:3.1f}%'.format(capacity, charge_level))
+            self._display.set_charge_level(charge_level)
+        if 314 + self._bms_id == can_id:
+            address, voltage, temperature = struct.unpack_from('>BHB', bytes(data))
+            voltage /= 100.0
+            logging.debug(u'Cell {:d} {:3.2f}V {:d}\u00b0C'.format(address, voltage, temperature))
+
+
+def frames(controller_share):
+    """
+    One cycle of scripts/battery.sh mixed with controller traffic of node 7, which the listener sees as well.
+    """
+    bms = [(0x137, struct.pack('>3H2B', 9000, 120, 100, 0, 0)),
+           (0x138, struct.pack('>HBH3B', 300, 3, 340, 17, 0, 30)),
+           (0x139, struct.pack('8B', 20, 30, 10, 0, 0, 0, 4, 9)),
+           (0x13a, struct.pack('>4H', 0, 2000, 600, 800))]
+    bms += [(0x13b, struct.pack('>BHB', i, random.randint(260, 355), 25)) for i in range(1, 31)]
+    controller = [(0x187, b'\x00' * 8), (0x287, b'\x00' * 8), (0x587, b'\x00' * 8), (0x707, b'\x05')]
+    count = int(len(bms) * controller_share / (1. - controller_share))
+    result = bms + [controller[i % len(controller)] for i in range(count)]
+    random.shuffle(result)
+    return [(can_id, bytearray(data)) for can_id, data in result]
+
+
+def measure(listener, data, seconds):
+    process = listener.process
+    count = 0
+    start = time.time()
+    end = start + seconds
+    while time.time() < end:
+        for can_id, payload in data:
+            process(can_id, payload, 0.)
+        count += len(data)
+    return count / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BMSListener decoding micro benchmark')
+    parser.add_argument('-t', default=2., type=float, help='seconds per measurement')
+    parser.add_argument('-c', default=.5, type=float, help='share of controller frames on the bus, 0 to <1')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    random.seed(0)
+    data = frames(args.c)
+    display = NullDisplay()
+    before = measure(LegacyBMSListener(display), data, args.t)
+    after = measure(BMSListener(display, Telemetry(), Liveness()), data, args.t)
+    print('before: {:10.0f} frames/s'.format(before))
+    print('after:  {:10.0f} frames/s'.format(after))
+    print('speedup: {:.2f}x'.format(after / before))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,138 @@
 import can
 import logging
 import struct
+from cellstats import CellStats
+
+# Layouts of the BMS frames, the key is the offset of the arbitration ID from 310 + BMS ID.
+# H:voltage*100 H:current H:energy B:reserved B:defect_cell_count
+VOLTAGE = struct.Struct('>3H2B')
+# H:min_voltage*100 B:min_cell_address H:max_voltage*100 B:max_cell_address B:reserved B:cell_count
+CELL_VOLTAGE = struct.Struct('>HBH3B')
+# B:average B:max B:min B:reserved B:reserved B:reserved B:min_cell_address B:max_cell_address
+TEMPERATURE = struct.Struct('8B')
+# H:low_limit H:current_limit H:capacity*10 H:charge_level*10
+CHARGE = struct.Struct('>4H')
+# B:address H:voltage*100 B:temperature
+CELL = struct.Struct('>BHB')
+
+
+class Pack(object):
+    """
+    Newest values of one battery pack.
+    """
+    __slots__ = ('bms_id', 'voltage', 'current', 'energy', 'capacity', 'charge_level', 'min_cell_voltage',
+                 'min_cell_address', 'cell_count', 'cells')
+
+    def __init__(self, bms_id):
+        self.bms_id = bms_id
+        self.voltage = None
+        self.current = 0
+        self.energy = 0
+        self.capacity = 0.
+        self.charge_level = 0.
+        self.min_cell_voltage = None
+        self.min_cell_address = 0
+        self.cell_count = 0
+        self.cells = CellStats()
+
+
+class Fleet(object):
+    """
+    Aggregates parallel packs: their mean voltage, total current and energy, the capacity weighted charge level and
+    the lowest cell of all packs. The sums are updated by the difference to the previous value of a pack, only the
+    lowest cell is searched among all packs.
+    """
+
+    def __init__(self, bms_ids):
+        self.packs = [Pack(bms_id) for bms_id in bms_ids]
+        self._voltages = 0
+        self._voltage = 0.
+        self.current = 0
+        self.energy = 0
+        self._capacity = 0.
+        self._charge = 0.
+
+    def voltage(self, pack, voltage, current, energy):
+        if pack.voltage is None:
+            self._voltages += 1
+        else:
+            self._voltage -= pack.voltage
+        self._voltage += voltage
+        self.current += current - pack.current
+        self.energy += energy - pack.energy
+        pack.voltage = voltage
+        pack.current = current
+        pack.energy = energy
+        return self._voltage / self._voltages
+
+    def charge(self, pack, capacity, charge_level):
+        self._capacity += capacity - pack.capacity
+        self._charge += capacity * charge_level - pack.capacity * pack.charge_level
+        pack.capacity = capacity
+        pack.charge_level = charge_level
+        if self._capacity > 0:
+            return self._charge / self._capacity
+        return charge_level
+
+    def min_cell(self, pack, voltage, address):
+        """
+        Returns the voltage and address of the lowest cell of all packs.
+        """
+        pack.min_cell_voltage = voltage
+        pack.min_cell_address = address
+        lowest = pack
+        for other in self.packs:
+            if other.min_cell_voltage is not None and other.min_cell_voltage < lowest.min_cell_voltage:
+                lowest = other
+        return lowest.min_cell_voltage, lowest.min_cell_address
+
+    def cells(self):
+        """
+        Combines the cell statistics of all packs into one CellStats.summary().
+        """
+        weakest = strongest = hottest = None
+        count = 0
+        total = 0.
+        for pack in self.packs:
+            summary = pack.cells.summary()
+            if summary is None:
+                continue
+            pack_weakest, pack_strongest, mean, imbalance, pack_hottest = summary
+            if weakest is None or pack_weakest[1] < weakest[1]:
+                weakest = pack_weakest
+            if strongest is None or pack_strongest[1] > strongest[1]:
+                strongest = pack_strongest
+            if hottest is None or pack_hottest[1] > hottest[1]:
+                hottest = pack_hottest
+            count += pack.cells.count
+            total += mean * pack.cells.count
+        if weakest is None:
+            return None
+        return weakest, strongest, total / count, strongest[1] - weakest[1], hottest
 
 
 class BMSListener(can.Listener):
-    _bms_id = 1
+    """
+    Receives the frames of one or more parallel battery packs. The frames of the pack with BMS ID n have the
+    arbitration IDs 310 + n to 314 + n, so the IDs of two packs must differ by at least 5. All IDs are dispatched by
+    one dictionary lookup, the display shows the aggregated values of all packs.
+    """
 
-    def __init__(self, display):
+    def __init__(self, display, telemetry, liveness, bms_ids=(1,)):
         super(BMSListener, self).__init__()
         self._display = display
+        self._telemetry = telemetry
+        self._liveness = liveness
+        self._fleet = Fleet(bms_ids)
+        self._dispatch = {}
+        for pack in self._fleet.packs:
+            for offset, entry in enumerate(((VOLTAGE, self.voltage), (CELL_VOLTAGE, self.cell_voltage),
+                                            (TEMPERATURE, self.temperature), (CHARGE, self.charge),
+                                            (CELL, self.cell))):
+                can_id = 310 + pack.bms_id + offset
+                if can_id in self._dispatch:
+                    raise ValueError('Frames of BMS {:d} collide with another BMS'.format(pack.bms_id))
+                self._dispatch[can_id] = entry + (pack,)
 
     def on_message_received(self, msg):
         if msg.is_error_frame or msg.is_remote_frame:
@@ -19,35 +143,52 @@ class BMSListener(can.Listener):
             logging.error(str(e))
 
     def process(self, can_id, data, timestamp):
-        if 310 + self._bms_id == can_id:
-            voltage, current, energy, reserved, defect_cell_count = struct.unpack_from('>3H2B', bytes(data))
-            voltage = voltage / 100.0
-            logging.debug(
-                'Voltage {:3.2f}V, Current {:d}A, Energy {:d}Ah, defect cells {:d}'.format(voltage, current, energy,
-                                                                                           defect_cell_count))
-            self._display.set_voltage(voltage)
-        if 311 + self._bms_id == can_id:
-            min_voltage, min_cell_address, max_voltage, max_cell_address, reserved, cell_count = struct.unpack_from(
-                '>HBH3B', bytes(data))
-            min_voltage /= 100.0
-            max_voltage /= 100.0
-            logging.debug('Minimum Voltage {:1.2f}V cell {:d}, maximum voltage {:1.2f}V cell: {:d}, cells {:d}'.format(
-                min_voltage, min_cell_address, max_voltage, max_cell_address, cell_count))
-            self._display.set_min_cell_address_voltage(min_cell_address, min_voltage)
-        if 312 + self._bms_id == can_id:
-            average_temperature, max_temperature, min_temperature, reserved, reserved, reserved, min_temp_cell_address, max_temp_cell_address = struct.unpack_from(
-                '8B', bytes(data))
-            logging.debug(
-                u'Average temperature {:d}\u00b0C, hottest temperature {:d}\u00b0C cell {:d}, coldest temperature {:d}\u00b0C, cell {:d}'.format(
-                    average_temperature, max_temperature, max_temp_cell_address, min_temperature,
-                    min_temp_cell_address))
-        if 313 + self._bms_id == can_id:
-            low_limit, current_limit, capacity, charge_level = struct.unpack_from('>4H', bytes(data))
-            capacity /= 10.0
-            charge_level /= 10.0
-            logging.debug('Capacity {:3.1f}Ah, Charge level {:3.1f}%'.format(capacity, charge_level))
-            self._display.set_charge_level(charge_level)
-        if 314 + self._bms_id == can_id:
-            address, voltage, temperature = struct.unpack_from('>BHB', bytes(data))
-            voltage /= 100.0
-            logging.debug(u'Cell {:d} {:3.2f}V {:d}\u00b0C'.format(address, voltage, temperature))
+        entry = self._dispatch.get(can_id)
+        if entry is None:
+            return
+        self._liveness.seen('bms', timestamp)
+        layout, handler, pack = entry
+        handler(pack, timestamp, *layout.unpack_from(data))
+
+    def voltage(self, pack, timestamp, voltage, current, energy, reserved, defect_cell_count):
+        voltage = voltage / 100.0
+        logging.debug('BMS %d: Voltage %3.2fV, Current %dA, Energy %dAh, defect cells %d', pack.bms_id, voltage,
+                      current, energy, defect_cell_count)
+        voltage = self._fleet.voltage(pack, voltage, current, energy)
+        self._telemetry.record('battery_voltage', timestamp, voltage)
+        self._telemetry.record('battery_current', timestamp, self._fleet.current)
+        self._telemetry.record('battery_energy', timestamp, self._fleet.energy)
+        self._display.set_voltage(voltage, timestamp)
+
+    def cell_voltage(self, pack, timestamp, min_voltage, min_cell_address, max_voltage, max_cell_address, reserved,
+                     cell_count):
+        min_voltage /= 100.0
+        max_voltage /= 100.0
+        logging.debug('BMS %d: Minimum Voltage %1.2fV cell %d, maximum voltage %1.2fV cell: %d, cells %d',
+                      pack.bms_id, min_voltage, min_cell_address, max_voltage, max_cell_address, cell_count)
+        pack.cell_count = cell_count
+        min_voltage, min_cell_address = self._fleet.min_cell(pack, min_voltage, min_cell_address)
+        self._telemetry.record('min_cell_voltage', timestamp, min_voltage)
+        self._display.set_min_cell_address_voltage(min_cell_address, min_voltage, timestamp)
+
+    def temperature(self, pack, timestamp, average_temperature, max_temperature, min_temperature, reserved1,
+                    reserved2, reserved3, min_temp_cell_address, max_temp_cell_address):
+        logging.debug(u'BMS %d: Average temperature %d\u00b0C, hottest temperature %d\u00b0C cell %d, coldest '
+                      u'temperature %d\u00b0C, cell %d', pack.bms_id, average_temperature, max_temperature,
+                      max_temp_cell_address, min_temperature, min_temp_cell_address)
+
+    def charge(self, pack, timestamp, low_limit, current_limit, capacity, charge_level):
+        capacity /= 10.0
+        charge_level /= 10.0
+        logging.debug('BMS %d: Capacity %3.1fAh, Charge level %3.1f%%', pack.bms_id, capacity, charge_level)
+        charge_level = self._fleet.charge(pack, capacity, charge_level)
+        self._telemetry.record('charge_level', timestamp, charge_level)
+        self._display.set_charge_level(charge_level, timestamp)
+
+    def cell(self, pack, timestamp, address, voltage, temperature):
+        voltage /= 100.0
+        logging.debug(u'BMS %d: Cell %d %3.2fV %d\u00b0C', pack.bms_id, address, voltage, temperature)
+        pack.cells.update(address, voltage, temperature)
+        # the statistics are shown once per cycle of cell frames, every frame while the cell count is unknown
+        if address >= pack.cell_count:
+            self._display.set_cells(self._fleet.cells(), timestamp)
@@ -0,0 +1,61 @@
+import can
+import logging
+import time
+
+STANDARD_MASK = 0x7FF
+
+
+def consumed_ids(node_ids, bms_ids, tpdo_cob_ids=()):
+    """
+    Returns the arbitration IDs EWA consumes: EMCY, SDO responses and heartbeats of the controllers, the given TPDO
+    COB-IDs and the frames of the battery packs.
+    """
+    ids = set()
+    for node_id in node_ids:
+        ids.update((0x80 + node_id, 0x580 + node_id, 0x700 + node_id))
+    for cob_id in tpdo_cob_ids:
+        ids.add(cob_id & STANDARD_MASK)
+    for bms_id in bms_ids:
+        ids.update(range(310 + bms_id, 315 + bms_id))
+    return sorted(ids)
+
+
+def can_filters(ids):
+    """
+    python-can filters letting pass exactly the given IDs, SocketCAN installs them in the kernel.
+    """
+    return [{'can_id': can_id, 'can_mask': STANDARD_MASK, 'extended': False} for can_id in ids]
+
+
+class FilterMonitor(can.Listener):
+    """
+    Counts the frames passing the filters and compares them with the frames the interface received, which the kernel
+    statistics of the CAN device tell.
+    """
+
+    def __init__(self, channel):
+        super(FilterMonitor, self).__init__()
+        self._statistics = '/sys/class/net/{:s}/statistics/rx_packets'.format(channel)
+        self.received = 0
+        self._start = time.time()
+        self._start_packets = self.rx_packets()
+
+    def on_message_received(self, msg):
+        self.received += 1
+
+    def rx_packets(self):
+        try:
+            with open(self._statistics) as f:
+                return int(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def report(self):
+        packets = self.rx_packets()
+        elapsed = time.time() - self._start
+        if packets is None or self._start_packets is None or elapsed <= 0:
+            logging.info('CAN filter: {:d} frames passed'.format(self.received))
+            return
+        filtered = packets - self._start_packets - self.received
+        logging.info('CAN filter: {:.0f} frames/s passed, {:.0f} frames/s filtered out'.format(
+            self.received / elapsed, max(0, filtered) / elapsed))
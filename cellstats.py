@@ -0,0 +1,113 @@
+from array import array
+
+# cell addresses are one byte
+MAX_CELLS = 256
+INFINITY = float('inf')
+
+
+class ExtremeTree(object):
+    """
+    Tournament tree over a fixed number of slots, which keeps the slot with the lowest, or with highest=True the
+    highest, value at its root. Changing one value replays at most the matches on the path to the root, O(log n).
+    """
+
+    def __init__(self, size, highest=False):
+        self._size = 1
+        while self._size < size:
+            self._size *= 2
+        self._highest = highest
+        self._empty = -INFINITY if highest else INFINITY
+        self._values = array('d', [self._empty]) * size
+        # winning slot of every match, the matches of node i are at 2i and 2i + 1, the leaves start at _size
+        self._winners = array('H', [0]) * (2 * self._size)
+        for slot in range(self._size):
+            self._winners[self._size + slot] = min(slot, size - 1)
+        for node in range(self._size - 1, 0, -1):
+            self._winners[node] = self._winners[2 * node]
+
+    def update(self, slot, value):
+        values = self._values
+        winners = self._winners
+        highest = self._highest
+        values[slot] = value
+        node = (self._size + slot) >> 1
+        while node:
+            left = winners[2 * node]
+            right = winners[2 * node + 1]
+            if highest:
+                winner = right if values[right] > values[left] else left
+            else:
+                winner = right if values[right] < values[left] else left
+            # the matches above only change if this one has a new winner or the changed slot takes part in them
+            if winner == winners[node] and winner != slot:
+                return
+            winners[node] = winner
+            node >>= 1
+
+    def best(self):
+        """
+        Returns the slot with the extreme value and the value, None if no value was set yet.
+        """
+        slot = self._winners[1]
+        value = self._values[slot]
+        if value == self._empty:
+            return None, None
+        return slot, value
+
+
+class CellStats(object):
+    """
+    Newest voltage and temperature of every cell of one pack in preallocated arrays. Every cell frame updates the sum
+    of the voltages and the trees of the weakest, strongest and hottest cell, so no statistic needs a scan over all
+    cells.
+    """
+
+    def __init__(self, cells=MAX_CELLS):
+        self._voltages = array('d', [0.]) * cells
+        self._known = array('B', [0]) * cells
+        self.count = 0
+        self._sum = 0.
+        self._weakest = ExtremeTree(cells)
+        self._strongest = ExtremeTree(cells, True)
+        self._hottest = ExtremeTree(cells, True)
+
+    def update(self, address, voltage, temperature):
+        if self._known[address]:
+            self._sum -= self._voltages[address]
+        else:
+            self._known[address] = 1
+            self.count += 1
+        self._sum += voltage
+        self._voltages[address] = voltage
+        self._weakest.update(address, voltage)
+        self._strongest.update(address, voltage)
+        self._hottest.update(address, temperature)
+
+    def mean(self):
+        return self._sum / self.count if self.count else None
+
+    def weakest(self):
+        """
+        Address and voltage of the cell with the lowest voltage.
+        """
+        return self._weakest.best()
+
+    def strongest(self):
+        return self._strongest.best()
+
+    def hottest(self):
+        """
+        Address and temperature of the hottest cell.
+        """
+        return self._hottest.best()
+
+    def summary(self):
+        """
+        Returns the weakest and the strongest cell, the mean voltage, the imbalance between the weakest and the
+        strongest cell and the hottest cell, None if no cell was received yet.
+        """
+        if not self.count:
+            return None
+        weakest = self._weakest.best()
+        strongest = self._strongest.best()
+        return weakest, strongest, self.mean(), strongest[1] - weakest[1], self._hottest.best()
@@ -1,8 +1,11 @@
 import logging
+import time
 import traceback
+from functools import partial
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.core.window import Window
+from kivy.factory import Factory
 from kivy.graphics import (
     Color,
     Ellipse
@@ -17,6 +20,20 @@ from kivy.uix.screenmanager import (
     NoTransition
 )
 from kivy.uix.widget import Widget
+from latency import (
+    AGE,
+    DISPLAY,
+    RECEIVE
+)
+from snapshot import (
+    FIELDS,
+    Snapshot,
+    SnapshotBuffer
+)
+
+# the modules are imported when the first screen using them is created
+Factory.register('Gauge', module='gauge')
+Factory.register('Bar', module='bar')
 
 
 def color(battery_level):
@@ -63,10 +80,18 @@ class Tow(Screen):
     _rope_speed_label = ObjectProperty(None)
     _force_label = ObjectProperty(None)
     _connected_color = ObjectProperty(None)
+    _emergency_label = ObjectProperty(None)
+    _shown_rpm = None
+    _shown_rope_speed = None
+    _shown_torque_kg = None
+    _shown_battery_level = None
 
     def connected(self, connected):
         self._connected_color.connected(connected)
 
+    def set_emergency(self, text):
+        self._emergency_label.text = text or ''
+
     def set_torque(self, value):
         old = self._force_gauge.get_value()
         if old == value:
@@ -82,15 +107,29 @@ class Tow(Screen):
             logging.error(traceback.format_exc())
 
     def set_rpm(self, value):
+        if value == self._shown_rpm:
+            return
+        self._shown_rpm = value
         self._rpm_label.text = '[size=50]{:d}[/size]\n[font=Roboto]1/min[/font]'.format(value)
 
     def set_rope_speed(self, value):
+        value = round(value, 1)
+        if value == self._shown_rope_speed:
+            return
+        self._shown_rope_speed = value
         self._rope_speed_label.text = '[size=50]{:.1f}[/size]\n[font=Roboto]km/h[/font]'.format(value)
 
     def set_torque_kg(self, value):
+        if value == self._shown_torque_kg:
+            return
+        self._shown_torque_kg = value
         self._force_label.text = '{:d}kg'.format(value)
 
     def set_battery_level(self, value):
+        value = round(value, 1)
+        if value == self._shown_battery_level:
+            return
+        self._shown_battery_level = value
         self._battery_bar.color = color(value)
         self._battery_bar.value = value
 
@@ -117,20 +156,47 @@ class Service(Screen):
     _charge_level = ObjectProperty(None)
     _min_voltage = ObjectProperty(None)
     _min_cell_address = ObjectProperty(None)
+    _imbalance = ObjectProperty(None)
+    _hottest_cell = ObjectProperty(None)
+    _shown_motor_temperature = None
+    _shown_controller_temperature = None
+    _shown_charge_level = None
+    _shown_min_cell = None
 
     def set_motor_temperature(self, value):
+        value = round(value, 1)
+        if value == self._shown_motor_temperature:
+            return
+        self._shown_motor_temperature = value
         self._motor_temperature.text = u'{:.1f}\u00b0C'.format(value)
 
     def set_controller_temperature(self, value):
+        value = round(value, 1)
+        if value == self._shown_controller_temperature:
+            return
+        self._shown_controller_temperature = value
         self._controller_temperature.text = u'{:.1f}\u00b0C'.format(value)
 
     def set_charge_level(self, level):
+        level = round(level, 1)
+        if level == self._shown_charge_level:
+            return
+        self._shown_charge_level = level
         self._charge_level.text = '{:3.1f}%'.format(level)
 
     def set_min_cell_address_voltage(self, address, voltage):
+        shown = (address, round(voltage, 2))
+        if shown == self._shown_min_cell:
+            return
+        self._shown_min_cell = shown
         self._min_cell_address.text = str(address)
         self._min_voltage.text = '{:1.2f}V'.format(voltage)
 
+    def set_cells(self, summary):
+        weakest, strongest, mean, imbalance, hottest = summary
+        self._imbalance.text = u'{:.0f}mV, \u00d8 {:1.2f}V'.format(imbalance * 1000, mean)
+        self._hottest_cell.text = u'{:.0f}\u00b0C, Zelle {:d}'.format(hottest[1], hottest[0])
+
 
 class Calibrate(Screen):
     _fifty_label = ObjectProperty(None)
@@ -190,58 +256,76 @@ class Calibrate(Screen):
 class Battery(Screen):
     _voltage = ObjectProperty(None)
     _level = ObjectProperty(None)
+    _cells = ObjectProperty(None)
+    _shown_voltage = None
+    _shown_level = None
 
     def set_voltage(self, voltage):
+        voltage = round(voltage, 2)
+        if voltage == self._shown_voltage:
+            return
+        self._shown_voltage = voltage
         self._voltage.color = color_voltage(voltage, 30.)
         self._voltage.text = '{:3.2f}Volt'.format(voltage)
 
     def set_charge_level(self, level):
+        level = round(level, 1)
+        if level == self._shown_level:
+            return
+        self._shown_level = level
         self._level.color = color(level)
         self._level.text = '{:3.1f}%'.format(level)
 
+    def set_cells(self, summary):
+        weakest, strongest, mean, imbalance, hottest = summary
+        self._cells.text = 'Zellen {:1.2f}V - {:1.2f}V'.format(weakest[1], strongest[1])
+
 
 class Display(ScreenManager):
-    pass
+    """
+    Creates every screen on its first visit, the screens not shown at start do not delay it.
+    """
+
+    def __init__(self, create, **kwargs):
+        self._create = create
+        super(Display, self).__init__(**kwargs)
+
+    def on_current(self, instance, value):
+        if value and not self.has_screen(value):
+            self.add_widget(self._create(value))
+        super(Display, self).on_current(instance, value)
 
 
 class DisplayApp(App):
-    _connected = False
-    _calibrate_measure = 0
-    _torque = 0
-    _rpm = 0
-    _rope_speed = 0
-    _motor_temperature = 0.
-    _controller_temperature = 0.
-    _battery_voltage = 0.
-    _battery_level = 0.
-    """Charge level of the battery. Values between 0 and 100"""
-    _min_cell_address = 0
-    _min_cell_voltage = 0.
-
-    def __init__(self, devel, mapping):
+    def __init__(self, devel, mapping, latency):
         self._devel = devel
         self._mapping = mapping
+        self._latency = latency
+        # receive and decode time of the newest value of every field
+        self._stamps = {}
+        self._snapshots = SnapshotBuffer()
+        # the snapshot shown before and the one shown now, reused every frame
+        self._shown = Snapshot()
+        self._frame = Snapshot()
         self._tow = None
         self._service = None
         self._calibrate = None
         self._battery = None
+        # text of the active controller emergencies, None without any
+        self._emergency = None
+        # names of the fields set to a new value but not yet shown, everything is shown once at start
+        self._changed = set(['measure', 'connected', 'torque', 'torque_kg', 'rpm', 'rope_speed', 'motor_temperature',
+                             'controller_temperature', 'min_cell', 'battery_voltage', 'battery_level'])
+        self.register_event_type('on_first_frame')
         super(DisplayApp, self).__init__()
 
     def build(self):
         if self._devel:
             Window.size = (800, 480)
-        display = Display()
+        display = Display(self.create_screen)
         display.transition = NoTransition()
-        self._tow = Tow()
-        display.add_widget(self._tow)
-        self._calibrate = Calibrate(self._mapping)
-        display.add_widget(self._calibrate)
-        display.add_widget(ForceSelect())
-        self._service = Service()
-        display.add_widget(self._service)
-        self._battery = Battery()
-        display.add_widget(self._battery)
         display.current = 'battery'
+        Window.bind(on_flip=self.flipped)
 
         Clock.schedule_interval(lambda *t: self.update(), 0.05)
         Clock.schedule_interval(lambda *t: self.update_slow(), 0.5)
@@ -249,58 +333,205 @@ class DisplayApp(App):
 
         return display
 
+    def create_screen(self, name):
+        """
+        Creates the screen with the given name and marks its fields, so that the next update shows their values.
+        """
+        if 'tow' == name:
+            self._tow = Tow()
+            self._tow.set_emergency(self._emergency)
+            self._changed.update(('connected', 'torque', 'torque_kg', 'rpm', 'rope_speed', 'battery_level'))
+            return self._tow
+        if 'calibrate' == name:
+            self._calibrate = Calibrate(self._mapping)
+            self._changed.add('measure')
+            return self._calibrate
+        if 'forceselect' == name:
+            return ForceSelect()
+        if 'service' == name:
+            self._service = Service()
+            self._changed.update(('motor_temperature', 'controller_temperature', 'min_cell', 'cells',
+                                  'battery_level'))
+            return self._service
+        if 'battery' == name:
+            self._battery = Battery()
+            self._changed.update(('battery_voltage', 'cells', 'battery_level'))
+            return self._battery
+        raise ValueError('Unknown screen ' + name)
+
+    def flipped(self, *args):
+        Window.unbind(on_flip=self.flipped)
+        self.dispatch('on_first_frame')
+
+    def on_first_frame(self):
+        pass
+
+    def changed(self, *fields):
+        """
+        Returns whether one of the fields was set to a new value since the last call and clears their marks.
+        """
+        result = False
+        for field in fields:
+            if field in self._changed:
+                self._changed.discard(field)
+                result = True
+        return result
+
+    def received(self, field, timestamp):
+        """
+        Records the latency from receiving a sample at timestamp until it reached the display and returns the time.
+        """
+        now = time.time()
+        if timestamp is not None:
+            self._latency.record(field, RECEIVE, now - timestamp)
+        return now
+
+    def publish(self, field, value, timestamp):
+        self.publish_all(((field, value),), timestamp)
+
+    def publish_all(self, values, timestamp):
+        """
+        Publishes the field and value pairs of one sample at once, a frame never shows only some of them.
+        """
+        for field, value in values:
+            now = self.received(field, timestamp)
+        for field in self._snapshots.publish_all(values):
+            self._stamps[field] = (timestamp, now)
+
+    def refresh(self):
+        """
+        Reads one consistent snapshot of all fields and marks those differing from the snapshot shown before.
+        """
+        self._shown, self._frame = self._frame, self._shown
+        frame = self._snapshots.read(self._frame)
+        shown = self._shown
+        for field in FIELDS:
+            if getattr(frame, field) != getattr(shown, field):
+                self._changed.add(field)
+        if frame.torque != shown.torque:
+            self._changed.add('torque_kg')
+        return frame
+
+    def rendered(self, field):
+        # every sample is recorded once, not again when a new screen shows it
+        stamps = self._stamps.pop(field, None)
+        if stamps is None:
+            return
+        now = time.time()
+        timestamp, decoded = stamps
+        self._latency.record(field, DISPLAY, now - decoded)
+        if timestamp is not None:
+            self._latency.record(field, AGE, now - timestamp)
+
     def update(self):
-        if self._calibrate:
-            self._calibrate.set_measure(self._calibrate_measure)
+        frame = self.refresh()
+        if self._calibrate and self.changed('measure'):
+            self._calibrate.set_measure(frame.measure)
+            self.rendered('measure')
         if self._tow:
-            self._tow.connected(self._connected)
-            self._tow.set_torque(self._torque)
-            self._tow.set_rpm(self._rpm)
-            self._tow.set_rope_speed(self._rope_speed)
+            if self.changed('connected'):
+                self._tow.connected(frame.connected)
+            if self.changed('torque'):
+                self._tow.set_torque(frame.torque)
+                self.rendered('torque')
+            if self.changed('rpm'):
+                self._tow.set_rpm(frame.rpm)
+                self.rendered('rpm')
+            if self.changed('rope_speed'):
+                self._tow.set_rope_speed(frame.rope_speed)
+                self.rendered('rope_speed')
 
     def update_slow(self):
-        if self._tow:
-            self._tow.set_torque_kg(self._torque)
+        frame = self.refresh()
+        if self._tow and self.changed('torque_kg'):
+            self._tow.set_torque_kg(frame.torque)
 
     def update_battery(self):
+        frame = self.refresh()
         if self._service:
-            self._service.set_motor_temperature(self._motor_temperature)
-            self._service.set_controller_temperature(self._controller_temperature)
-            self._service.set_charge_level(self._battery_level)
-            self._service.set_min_cell_address_voltage(self._min_cell_address, self._min_cell_voltage)
-        if self._battery:
-            self._battery.set_voltage(self._battery_voltage)
-            self._battery.set_charge_level(self._battery_level)
-        if self._tow:
-            self._tow.set_battery_level(self._battery_level)
+            if self.changed('motor_temperature'):
+                self._service.set_motor_temperature(frame.motor_temperature)
+                self.rendered('motor_temperature')
+            if self.changed('controller_temperature'):
+                self._service.set_controller_temperature(frame.controller_temperature)
+                self.rendered('controller_temperature')
+            if self.changed('min_cell'):
+                self._service.set_min_cell_address_voltage(*frame.min_cell)
+                self.rendered('min_cell')
+        if self._battery and self.changed('battery_voltage'):
+            self._battery.set_voltage(frame.battery_voltage)
+            self.rendered('battery_voltage')
+        if frame.cells is not None and self.changed('cells'):
+            if self._service:
+                self._service.set_cells(frame.cells)
+            if self._battery:
+                self._battery.set_cells(frame.cells)
+            self.rendered('cells')
+        if self.changed('battery_level'):
+            if self._service:
+                self._service.set_charge_level(frame.battery_level)
+            if self._battery:
+                self._battery.set_charge_level(frame.battery_level)
+            if self._tow:
+                self._tow.set_battery_level(frame.battery_level)
+            self.rendered('battery_level')
 
     def connected(self, connected):
-        self._connected = connected
+        self._snapshots.publish('connected', connected)
 
-    def set_measure(self, value):
-        self._calibrate_measure = value
+    def emergency(self, text):
+        """
+        Shows the emergency text on the tow screen with the next frame instead of the next update. May be called from
+        any thread.
+        """
+        Clock.schedule_once(partial(self.show_emergency, text))
 
-    def set_torque(self, value):
-        self._torque = value
+    def show_emergency(self, text, *args):
+        self._emergency = text
+        if self._tow:
+            self._tow.set_emergency(text)
 
-    def set_rpm(self, value):
-        self._rpm = value
+    def set_measure(self, value, timestamp=None):
+        self.publish('measure', value, timestamp)
 
-    def set_rope_speed(self, value):
-        self._rope_speed = value
+    def set_torque(self, value, timestamp=None):
+        self.publish('torque', value, timestamp)
 
-    def set_motor_temperature(self, value):
-        self._motor_temperature = value
+    def set_force(self, measure, torque, timestamp=None):
+        """
+        Raw throttle value and the force mapped from it.
+        """
+        self.publish_all((('measure', measure), ('torque', torque)), timestamp)
 
-    def set_controller_temperature(self, value):
-        self._controller_temperature = value
+    def set_rpm(self, value, timestamp=None):
+        self.publish('rpm', value, timestamp)
 
-    def set_voltage(self, value):
-        self._battery_voltage = value
+    def set_rope_speed(self, value, timestamp=None):
+        self.publish('rope_speed', value, timestamp)
 
-    def set_charge_level(self, value):
-        self._battery_level = value
+    def set_speed(self, rpm, rope_speed, timestamp=None):
+        """
+        Motor speed and the rope speed calculated from it.
+        """
+        self.publish_all((('rpm', rpm), ('rope_speed', rope_speed)), timestamp)
 
-    def set_min_cell_address_voltage(self, address, voltage):
-        self._min_cell_address = address
-        self._min_cell_voltage = voltage
+    def set_motor_temperature(self, value, timestamp=None):
+        self.publish('motor_temperature', value, timestamp)
+
+    def set_controller_temperature(self, value, timestamp=None):
+        self.publish('controller_temperature', value, timestamp)
+
+    def set_voltage(self, value, timestamp=None):
+        self.publish('battery_voltage', value, timestamp)
+
+    def set_charge_level(self, value, timestamp=None):
+        """
+        Charge level of the battery. Values between 0 and 100
+        """
+        self.publish('battery_level', value, timestamp)
+
+    def set_min_cell_address_voltage(self, address, voltage, timestamp=None):
+        self.publish('min_cell', (address, voltage), timestamp)
+
+    def set_cells(self, summary, timestamp=None):
+        self.publish('cells', summary, timestamp)
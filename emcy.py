@@ -0,0 +1,137 @@
+import collections
+import logging
+import struct
+
+# H:error code B:error register 5s:manufacturer specific
+EMCY = struct.Struct('<HB5s')
+
+# Error codes of CiA 301 and the drive specific ones of CiA 402
+CODES = {
+    0x0000: 'Error reset',
+    0x1000: 'Generic error',
+    0x2000: 'Current',
+    0x2100: 'Current, device input side',
+    0x2200: 'Current inside the device',
+    0x2300: 'Current, device output side',
+    0x2310: 'Continuous over current',
+    0x2320: 'Short circuit or earth leakage',
+    0x3000: 'Voltage',
+    0x3100: 'Mains voltage',
+    0x3200: 'Voltage inside the device',
+    0x3210: 'DC link over voltage',
+    0x3220: 'DC link under voltage',
+    0x3300: 'Output voltage',
+    0x4000: 'Temperature',
+    0x4100: 'Ambient temperature',
+    0x4200: 'Device temperature',
+    0x4210: 'Excess temperature device',
+    0x4300: 'Drive temperature',
+    0x4310: 'Excess temperature drive',
+    0x5000: 'Device hardware',
+    0x5100: 'Device hardware supply',
+    0x5400: 'Power section',
+    0x6000: 'Device software',
+    0x6100: 'Internal software',
+    0x6200: 'User software',
+    0x6300: 'Data set',
+    0x7000: 'Additional modules',
+    0x7100: 'Power',
+    0x7121: 'Motor blocked',
+    0x7300: 'Sensor',
+    0x7305: 'Incremental sensor 1 fault',
+    0x8000: 'Monitoring',
+    0x8100: 'Communication',
+    0x8110: 'CAN overrun, objects lost',
+    0x8120: 'CAN in error passive mode',
+    0x8130: 'Life guard or heartbeat error',
+    0x8140: 'Recovered from bus off',
+    0x8150: 'CAN-ID collision',
+    0x8200: 'Protocol error',
+    0x8210: 'PDO not processed due to length error',
+    0x8220: 'PDO length exceeded',
+    0x8240: 'Unexpected SYNC data length',
+    0x8250: 'RPDO timeout',
+    0x8600: 'Positioning controller',
+    0x8611: 'Following error',
+    0x9000: 'External error',
+    0xF000: 'Additional functions',
+    0xFF00: 'Device specific',
+}
+
+REGISTER_BITS = ('generic', 'current', 'voltage', 'temperature', 'communication', 'device profile', 'reserved',
+                 'manufacturer')
+
+
+def _classes():
+    """
+    Description of every high byte of an error code: the code of that class or of its group.
+    """
+    result = []
+    for high in range(256):
+        code = high << 8
+        result.append(CODES.get(code) or CODES.get(code & 0xF000) or 'Unknown error')
+    return result
+
+
+# Precomputed, so decoding a frame costs two lookups instead of searching the classes.
+CLASSES = _classes()
+REGISTERS = [', '.join(name for bit, name in enumerate(REGISTER_BITS) if value & (1 << bit)) for value in range(256)]
+
+
+def describe(code):
+    return CODES.get(code) or CLASSES[code >> 8]
+
+
+class Emergency(object):
+    __slots__ = ('timestamp', 'node_id', 'code', 'register', 'data', 'description')
+
+    def __init__(self, timestamp, node_id, code, register, data):
+        self.timestamp = timestamp
+        self.node_id = node_id
+        self.code = code
+        self.register = register
+        self.data = data
+        self.description = describe(code)
+
+    def reset(self):
+        """
+        Whether the node cleared all its errors.
+        """
+        return 0 == self.code
+
+    def __str__(self):
+        return 'Node {:d}: 0x{:04X} {:s}, error register {:s}'.format(self.node_id, self.code, self.description,
+                                                                      REGISTERS[self.register] or 'clear')
+
+
+class EmergencyMonitor(object):
+    """
+    Decodes the EMCY frames of the nodes it is subscribed for and calls handler(emergency) within the receiving
+    thread. The newest history emergencies are kept.
+    """
+
+    def __init__(self, handler, history=32):
+        self._handler = handler
+        self._history = collections.deque(maxlen=history)
+        self.count = 0
+
+    def subscribe(self, network, node_id):
+        network.subscribe(0x80 + node_id, self.on_emcy)
+
+    def on_emcy(self, can_id, data, timestamp):
+        # CiA 301 EMCY frames have 8 bytes
+        if len(data) < EMCY.size:
+            return
+        code, register, specific = EMCY.unpack_from(data)
+        emergency = Emergency(timestamp, can_id - 0x80, code, register, bytes(specific))
+        self._history.append(emergency)
+        self.count += 1
+        self._handler(emergency)
+
+    def history(self):
+        return list(self._history)
+
+    def report(self):
+        logging.info('{:d} emergencies'.format(self.count))
+        for emergency in self._history:
+            logging.info(str(emergency))
@@ -1,17 +1,56 @@
 import argparse
 import canopen
 import logging
+import odcache
 import signal
 import sys
 import time
 import traceback
 from bmslistener import BMSListener
+from canfilter import (
+    FilterMonitor,
+    can_filters,
+    consumed_ids
+)
 from canopen import nmt
-from display import DisplayApp
+from emcy import EmergencyMonitor
 from enum import Enum
+from forcefilter import ForceFilter
 from forcemapping import ForceMapping
+from functools import partial
+from latency import (
+    DETECTION,
+    LatencyMonitor
+)
+from liveness import Liveness
+from profiler import SamplingProfiler
 from ropespeed import RopeSpeed
-from threading import Thread
+from scheduler import PollScheduler
+from startup import Startup
+from telemetry import (
+    SIGNALS,
+    Telemetry
+)
+from telemetrylog import TelemetryLog
+from throttle import Throttle
+from threading import (
+    Event,
+    Lock,
+    Thread
+)
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# producer heartbeat time of the controller in milliseconds
+HEARTBEAT_TIME = 100
+# seconds without heartbeat until the heartbeat is stale
+HEARTBEAT_DEADLINE = 0.25
+# stacks sampled with -P in the collapsed format of flamegraph.pl
+PROFILE = 'ewa-profile.txt'
 
 
 class State(Enum):
@@ -20,55 +59,202 @@ class State(Enum):
     ONLINE = 2
 
 
+class Trigger(Enum):
+    HEARTBEAT = 0
+    TIMEOUT = 1
+    STOP = 2
+    # boot-up of an additional controller
+    SECONDARY = 3
+
+
 class Ewa(object):
     def __init__(self):
         self._PDO = False
         self._mapping = ForceMapping()
+        self._force_filter = ForceFilter()
         self._display = None
         self._run = True
         self._state = State.OFFLINE
         self._network = None
         self._controller = None
-        self._main_thread = Thread(target=self.mainloop)
-        self._read = False
+        # additional controllers, only their heartbeat is configured and supervised
+        self._secondaries = []
+        self._node_ids = []
+        self._bms_ids = []
+        # COB-IDs of the used TPDOs, they pass the CAN filters in PDO mode
+        self._tpdo_cob_ids = []
+        self._filter_monitor = None
+        # local I2C force sensor replacing the Throttle_Command of the controller
+        self._throttle = None
+        self._profiler = None
+        self._emergencies = EmergencyMonitor(self.on_emergency)
+        # description of the active emergency of every node
+        self._faults = {}
+        self._main_thread = Thread(target=self.mainloop, name='main')
+        self._events = queue.Queue()
+        self._deadline = None
+        self._reading = Event()
+        self._read_idle = Event()
+        # SDO clients share one response queue and timeout per node, so only one request may run at a time
+        self._sdo_lock = Lock()
         self._read_thread = None
-        self._monitor_thread = None
-        self._heartbeat = False
-        self._received_data = False
+        self._connect_thread = None
+        # set as soon as the display exists
+        self._display_ready = Event()
+        self._startup = Startup()
+        self._liveness = Liveness()
+        # seconds without a frame until a signal is stale
+        self._liveness.watch('heartbeat', HEARTBEAT_DEADLINE)
+        self._liveness.watch('throttle', 0.35)
+        self._liveness.watch('rpm', 0.35)
+        self._liveness.watch('motor_temperature', 3.)
+        self._liveness.watch('controller_temperature', 3.)
+        self._liveness.watch('controller_voltage', 3.)
+        self._liveness.watch('bms', 3.)
+        # whether the controller got its configuration and did not restart since
+        self._configured = False
+        self._offline_since = None
+        self._scheduler = None
+        self._telemetry = Telemetry()
+        self._latency = LatencyMonitor()
+        # TPDO number, event timer in milliseconds, inhibit time in 100 microseconds, mapped objects
+        self._tpdos = (
+            (1, 100, 100, ((0x3216, self.show_data), (0x3207, self.show_rpm))),
+            (2, 1000, 5000, ((0x320b, self.show_motor_temperature), (0x322a, self.show_controller_temperature))),
+            (3, 1000, 5000, ((0x324d, self.show_voltage),)),
+        )
 
     def start(self, args):
+        if args.P is not None:
+            self._profiler = SamplingProfiler(args.I / 1000., args.P)
+            self._profiler.start()
         self._devel = args.d
+        self._PDO = args.p
+        if args.l:
+            self._telemetry.log = TelemetryLog(args.l, [name for name, capacity in SIGNALS], args.s * 1024 * 1024)
+        if args.f:
+            self._throttle = Throttle(self.show_data, rate=args.f)
+        self._scheduler = PollScheduler(self.read_sdo, not self._devel)
+        # force and speed every 100 milliseconds, temperatures and voltage every second
+        if not self._throttle:
+            self._scheduler.add('Throttle_Command', 0x3216, self.show_data, 0.1, 0)
+        self._scheduler.add('RPM', 0x3207, self.show_rpm, 0.1, 1)
+        self._scheduler.add('motor temperature', 0x320b, self.show_motor_temperature, 1., 2)
+        self._scheduler.add('controller temperature', 0x322a, self.show_controller_temperature, 1., 2)
+        self._scheduler.add('voltage', 0x324d, self.show_voltage, 1., 3)
+        # loading the object dictionary and connecting the CAN bus overlap with loading Kivy and building the UI
+        self._connect_thread = Thread(target=self.connect, args=(args.dev, args.n or [7], args.b or [1]),
+                                      name='connect')
+        self._connect_thread.start()
         self._mapping.read()
-        self._display = DisplayApp(args.d, self._mapping)
-        self._network = canopen.Network()
-        self._network.listeners = self._network.listeners + [BMSListener(self._display)]
-        self._network.connect(bustype='socketcan', channel=args.dev)
-        self._controller = self._network.add_node(7, 'CANopenSocket.eds')
-        # main EWA thread here
-        self._main_thread.start()
+        self._startup.mark('force mapping read')
+        # imported here, so that the acquisition path can be used without Kivy, e.g. by benchmark.py
+        from display import DisplayApp
+        self._startup.mark('Kivy loaded')
+        self._display = DisplayApp(args.d, self._mapping, self._latency)
+        self._display.bind(on_start=lambda *args: self._startup.mark('UI built'))
+        self._display.bind(on_first_frame=lambda *args: self.started())
+        self._display_ready.set()
+        if self._throttle:
+            self._throttle.start()
         # blocks until the UI ends
         try:
             self._display.run()
         except BaseException as e:
             logging.error(traceback.format_exc())
 
+    def connect(self, dev, node_ids, bms_ids):
+        """
+        Loads the object dictionary and connects the CAN bus while the main thread builds the UI. Starts the EWA threads
+        afterwards. The first controller node provides the shown telemetry. A failure is logged and shown on the tow
+        screen, the UI keeps running without the controllers.
+        """
+        try:
+            controllers = [canopen.RemoteNode(node_id, odcache.load('CANopenSocket.eds', node_id))
+                           for node_id in node_ids]
+            self._node_ids = node_ids
+            self._bms_ids = bms_ids
+            # default COB-IDs until the TPDO configuration is read
+            self._tpdo_cob_ids = [0x80 + 0x100 * number + node_ids[0] for number, event_timer, inhibit_time, objects in
+                                  self._tpdos]
+            self._startup.mark('object dictionary loaded')
+            # the BMS listener needs the display
+            self._display_ready.wait()
+            if not self._run:
+                return
+            network = canopen.Network()
+            self._filter_monitor = FilterMonitor(dev)
+            network.listeners = network.listeners + [
+                BMSListener(self._display, self._telemetry, self._liveness, bms_ids), self._filter_monitor]
+            # the kernel drops every frame EWA does not consume before python-can copies it
+            network.connect(bustype='socketcan', channel=dev, can_filters=self.can_filters())
+            # disconnected by stop() even if a later step fails
+            self._network = network
+            self._startup.mark('CAN bus connected')
+            for controller in controllers:
+                network.add_node(controller)
+                self._emergencies.subscribe(network, controller.id)
+            self._controller = controllers[0]
+            self._secondaries = controllers[1:]
+            for controller in self._secondaries:
+                self._liveness.watch('heartbeat {:d}'.format(controller.id), HEARTBEAT_DEADLINE)
+            if self._PDO:
+                for number, event_timer, inhibit_time, objects in self._tpdos:
+                    # the TPDO keeps its layout, but a local force sensor replaces the throttle of the controller
+                    handlers = [self.ignore if self._throttle and 0x3216 == index else handler
+                                for index, handler in objects]
+                    self._controller.pdo.tx[number].add_callback(partial(self.received, handlers))
+            if not self._PDO:
+                self._read_thread = Thread(target=self.read, name='read')
+                self._read_thread.start()
+            # main EWA thread here
+            self._main_thread.start()
+        except BaseException as e:
+            logging.error(traceback.format_exc())
+            self._display_ready.wait()
+            if self._run:
+                self._display.emergency('Connecting the controllers failed:\n{!s}'.format(e))
+
+    def started(self):
+        self._startup.mark('first frame')
+        self._startup.report()
+
     def stop(self):
         self._run = False
-        self._read = False
+        self._reading.set()
+        self._events.put((Trigger.STOP, None))
+        self._display_ready.set()
+        if self._throttle:
+            self._throttle.stop()
+        if self._profiler:
+            self._profiler.stop()
         self._mapping.write()
-        if self._monitor_thread:
-            self._monitor_thread.join()
-            self._monitor_thread = None
+        if self._connect_thread:
+            self._connect_thread.join()
+            self._connect_thread = None
         if self._read_thread:
             self._read_thread.join()
             self._read_thread = None
-        if self._main_thread:
+        self.report()
+        if self._telemetry.log:
+            self._telemetry.log.stop()
+            self._telemetry.log.report()
+            self._telemetry.log = None
+        if self._profiler:
+            self._profiler.report()
+            self._profiler.write(PROFILE)
+            logging.info('Profile of {:d} samples written to {:s}'.format(self._profiler.samples, PROFILE))
+            self._profiler = None
+        if self._main_thread and self._main_thread.is_alive():
             self._main_thread.join()
             self._main_thread = None
         if self._controller:
             self._controller.pdo.tx[1].stop()
             self._controller.nmt.state = 'STOPPED'
             self._controller = None
+        for controller in self._secondaries:
+            controller.nmt.state = 'STOPPED'
+        self._secondaries = []
         if self._network:
             self._network.disconnect()
             self._network = None
@@ -77,193 +263,361 @@ class Ewa(object):
             self._display = None
 
     def mainloop(self):
-        next_state = State.OFFLINE
+        """
+        Dispatches heartbeats and timeouts to the current state. The thread sleeps until either a heartbeat arrives,
+        the deadline of the current state passes or a signal may become stale.
+        """
+        self._network.subscribe(0x700 + self._controller.id, self.on_heartbeat)
+        for controller in self._secondaries:
+            self._network.subscribe(0x700 + controller.id, partial(self.on_secondary_heartbeat, controller))
+        self.enter(State.OFFLINE)
         while self._run:
-            # print('%s' % self._state)
+            deadlines = [deadline for deadline in (self._deadline, self._liveness.next_check()) if deadline is not None]
+            try:
+                if deadlines:
+                    trigger, value = self._events.get(timeout=max(0., min(deadlines) - time.time()))
+                else:
+                    trigger, value = self._events.get()
+            except queue.Empty:
+                trigger, value = Trigger.TIMEOUT, None
+            if Trigger.STOP == trigger:
+                break
+            self.check_liveness()
+            if Trigger.SECONDARY == trigger:
+                self.configure_secondary(value)
+                continue
+            if Trigger.TIMEOUT == trigger and self._deadline is not None and time.time() < self._deadline:
+                continue
             if State.OFFLINE == self._state:
-                next_state = self.offline()
-            if State.INIT == self._state:
-                next_state = self.init()
-            if State.ONLINE == self._state:
-                next_state = self.online()
-            self._state = next_state
-
-    def offline(self):
-        if not self._PDO:
-            if self._read:
-                self._read = False
-                print('Stop')
-                self._read_thread.join()
-                self._read_thread = None
-        self.connected(False)
-        if self._monitor_thread:
-            self._monitor_thread.join()
-            self._monitor_thread = None
-        nmt_state = None
+                next_state = self.offline(trigger, value)
+            else:
+                next_state = self.online(trigger, value)
+            if next_state != self._state:
+                self.enter(next_state)
+
+    def enter(self, state):
+        while self._run:
+            self._state = state
+            if State.OFFLINE == state:
+                self.pause_read()
+                self.connected(False)
+                self._offline_since = time.time()
+                if not self._configured:
+                    self.configure_heartbeat()
+                # a configured controller gets one second to show up again before it is configured from scratch
+                self._deadline = time.time() + 1.
+                return
+            if State.INIT == state:
+                # a boot-up while online leaves the poller running, it must not share the SDO client with init()
+                self.pause_read()
+                state = self.init()
+                continue
+            self.connected(True)
+            self._deadline = self._liveness.next_check() or time.time() + HEARTBEAT_DEADLINE
+            if self._offline_since is not None:
+                logging.info('Online after {:.0f}ms'.format((time.time() - self._offline_since) * 1000))
+            return
+
+    def on_heartbeat(self, can_id, data, timestamp):
+        # the highest bit of the NMT state is the toggle bit
+        state = data[0] & 0x7F if data else None
+        self._liveness.seen('heartbeat', timestamp)
+        # the liveness timer supervises an online controller, only a restart needs to wake up the dispatcher
+        if State.ONLINE != self._state or 0 == state:
+            self._events.put((Trigger.HEARTBEAT, state))
+
+    def on_emergency(self, emergency):
+        """
+        Runs in the notifier thread, so the fault is logged and handed to the display without waiting for any polling.
+        """
+        if emergency.reset():
+            logging.info(str(emergency))
+            self._faults.pop(emergency.node_id, None)
+        else:
+            logging.error(str(emergency))
+            self._faults[emergency.node_id] = '{:d}: 0x{:04X} {:s}'.format(emergency.node_id, emergency.code,
+                                                                          emergency.description)
+        if self._display:
+            self._display.emergency('\n'.join(text for node_id, text in sorted(self._faults.items())) or None)
+
+    def on_secondary_heartbeat(self, controller, can_id, data, timestamp):
+        self._liveness.seen('heartbeat {:d}'.format(controller.id), timestamp)
+        if data and 0 == data[0] & 0x7F:
+            self._events.put((Trigger.SECONDARY, controller))
+
+    def step(self, controller, name, budget, function, *args):
+        """
+        Runs one configuration step of the controller with SDO requests timing out after budget seconds. Returns whether
+        it succeeded.
+        """
+        sdo = controller.sdo
+        start = time.time()
+        # the budget must not shorten the timeout of the polling thread
+        with self._sdo_lock:
+            timeout = sdo.RESPONSE_TIMEOUT
+            sdo.RESPONSE_TIMEOUT = budget
+            try:
+                function(*args)
+                return True
+            except canopen.sdo.exceptions.SdoError as e:
+                logging.info('Failed to ' + name + '.')
+                return False
+            finally:
+                sdo.RESPONSE_TIMEOUT = timeout
+                elapsed = time.time() - start
+                if elapsed > budget:
+                    logging.info('{:s} took {:.0f}ms, budget {:.0f}ms'.format(name, elapsed * 1000, budget * 1000))
+
+    @staticmethod
+    def write_heartbeat_time(controller):
+        controller.sdo['Producer heartbeat time'].raw = HEARTBEAT_TIME
+
+    def configure_heartbeat(self):
         try:
             self._controller.nmt.state = 'PRE-OPERATIONAL'
-            self._controller.sdo['Producer heartbeat time'].raw = 1000
-        except canopen.sdo.SdoCommunicationError as e:
-            logging.exception('Failed to configure heartbeat.')
+            self.step(self._controller, 'configure heartbeat', 0.1, self.write_heartbeat_time, self._controller)
         except BaseException as e:
             logging.error(traceback.format_exc())
+
+    def configure_secondary(self, controller):
         try:
-            nmt_state = self._controller.nmt.wait_for_heartbeat(0.1)
-        except canopen.nmt.NmtError as e:
-            pass
-        if nmt_state:
-            self.connected(True)
+            controller.nmt.state = 'PRE-OPERATIONAL'
+            self.step(controller, 'configure heartbeat of node {:d}'.format(controller.id), 0.1,
+                      self.write_heartbeat_time, controller)
+            controller.nmt.state = 'OPERATIONAL'
+        except BaseException as e:
+            logging.error(traceback.format_exc())
+
+    def offline(self, trigger, value):
+        if Trigger.HEARTBEAT == trigger:
+            if self._configured and 5 == value:
+                # short dropout, the controller kept its configuration and is still operational
+                self._reading.set()
+                return State.ONLINE
+            if 0 == value:
+                # boot-up, the controller lost its configuration
+                self._configured = False
             return State.INIT
+        self._configured = False
+        self.configure_heartbeat()
+        self._deadline = time.time() + 1.
         return State.OFFLINE
 
     def init(self):
-        # TODO somewhere here SDO timeouts may occur.
         self._controller.nmt.state = 'PRE-OPERATIONAL'
-        try:
-            self._controller.sdo['Producer heartbeat time'].raw = 1000
-        except canopen.sdo.SdoCommunicationError as e:
-            logging.info('Failed to configure heartbeat.')
+        configured = True
+        if not self._configured:
+            configured = self.step(self._controller, 'configure heartbeat', 0.1, self.write_heartbeat_time,
+                                   self._controller)
+            for controller in self._secondaries:
+                self.configure_secondary(controller)
         if self._PDO:
-            try:
-                self._controller.pdo.read()
-            except canopen.sdo.SdoCommunicationError as e:
-                logging.info('Failed to read PDO configuration.')
-            self._controller.pdo.tx[1].clear()
-            # TODO replace with Throttle_Command 0x3216, subindex 0 length 2 readonly
-            self._controller.pdo.tx[1].add_variable(0x2110, 1)
-            # Asynchronous PDO. If one process variable changes, the data is transfered.
-            self._controller.pdo.tx[1].trans_type = 254
-            # Transmit at least every 1000 milliseconds.
-            self._controller.pdo.tx[1].event_timer = 1000
-            self._controller.pdo.tx[1].enabled = True
-            self._controller.pdo.tx[1].add_callback(callback=self.received)
-            try:
-                self._controller.pdo.save()
-            except canopen.sdo.SdoCommunicationError as e:
-                logging.info('Failed to save PDO configuration.')
-        else:
-            if not self._read:
-                self._read = True
-                logging.debug('Starting read thread')
-                self._read_thread = Thread(target=self.read)
-                self._read_thread.start()
+            configured = self.configure_pdo() and configured
+        # configure_pdo() falls back to SDO polling if the controller rejects the TPDOs
+        if not self._PDO:
+            self._reading.set()
         # TODO With the initialisation problem the emulator will not go back into operational mode and we get no data.
         self._controller.nmt.state = 'OPERATIONAL'
-        if self._monitor_thread:
-            print('Monitor thread not gone')
-        else:
-            self._monitor_thread = Thread(target=self.monitor_heartbeat)
-            self._monitor_thread.start()
+        # a failed step is tried again with the next INIT
+        self._configured = configured
         return State.ONLINE
 
-    def read(self):
-        count = 0
-        while self._read:
-            try:
-                value = self._controller.sdo[0x3216].raw
-                self.show_data(value)
-            except canopen.sdo.SdoError:
-                if not self._devel:
-                    logging.exception('Reading Throttle_Command failed')
-            try:
-                value = self._controller.sdo[0x3207].raw
-                self.show_rpm(value)
-            except canopen.sdo.SdoError:
-                if not self._devel:
-                    logging.exception('Reading RPM failed')
-            if count >= 10:
-                try:
-                    value = self._controller.sdo[0x320b].raw
-                    self.show_motor_temperature(value)
-                except canopen.sdo.SdoError:
-                    if not self._devel:
-                        logging.exception('Reading motor temperature failed')
-                try:
-                    value = self._controller.sdo[0x322a].raw
-                    self.show_controller_temperature(value)
-                except canopen.sdo.SdoError:
-                    if not self._devel:
-                        logging.exception('Reading controller temperature failed')
-                try:
-                    value = self._controller.sdo[0x324d].raw
-                    self.show_voltage(value)
-                except canopen.sdo.SdoError:
-                    if not self._devel:
-                        logging.exception('Reading voltage failed')
-                count = 0
-            time.sleep(0.1)
-            count += 1
-
-    def online(self):
+    def online(self, trigger, value):
         """
-        Just monitor the heartbeat and change state accordingly. Make the main thread sleep running through the states.
+        The controller stays online as long as its heartbeat or the force signal is alive, if the controller provides
+        the force. A boot-up message means the controller restarted and needs to be configured again.
         """
-        time.sleep(0.1)
-        if self._heartbeat:
+        if Trigger.HEARTBEAT == trigger and 0 == value:
+            self._configured = False
+            return State.INIT
+        now = time.time()
+        if self._liveness.alive('heartbeat', now) or (not self._throttle and self._liveness.alive('throttle', now)):
+            self._deadline = self._liveness.next_check()
             return State.ONLINE
-        else:
-            return State.OFFLINE
+        return State.OFFLINE
+
+    def check_liveness(self):
+        stale, recovered = self._liveness.check(time.time())
+        for name, delay in stale:
+            self._latency.record(name, DETECTION, delay)
+            logging.warning('No {:s} received in time, detected {:.1f}ms late'.format(name, delay * 1000))
+        for name in recovered:
+            logging.info('Receiving {:s} again'.format(name))
+
+    def read(self):
+        """
+        Long living SDO polling thread, it idles while the controller is offline. An exception ends it, but never leaves
+        pause_read() waiting.
+        """
+        try:
+            while self._run:
+                self._read_idle.set()
+                self._reading.wait()
+                self._read_idle.clear()
+                self._scheduler.run(lambda: self._run and self._reading.is_set())
+        except BaseException as e:
+            logging.error(traceback.format_exc())
+        finally:
+            self._read_idle.set()
+
+    def pause_read(self):
+        self._reading.clear()
+        if self._read_thread:
+            self._read_idle.wait()
+
+    def read_sdo(self, index):
+        with self._sdo_lock:
+            return self._controller.sdo[index].raw
+
+    def configure_pdo(self):
+        """
+        Reads only the used TPDOs and writes those back whose configuration differs from the wanted one. Returns whether
+        all TPDOs are configured. The EDS declares the objects as not mappable, if the controller agrees and aborts
+        saving a TPDO, EWA polls them over SDO instead.
+        """
+        configured = True
+        rejected = []
+        for number, event_timer, inhibit_time, objects in self._tpdos:
+            tpdo = self._controller.pdo.tx[number]
+            if not self.step(self._controller, 'read TPDO{:d} configuration'.format(number), 0.2, tpdo.read):
+                configured = False
+                continue
+            if [(var.index, var.subindex) for var in tpdo.map] == [(index, 0) for index, handler in objects] and \
+                    254 == tpdo.trans_type and event_timer == tpdo.event_timer and \
+                    inhibit_time == tpdo.inhibit_time and tpdo.enabled:
+                continue
+            tpdo.clear()
+            for index, handler in objects:
+                tpdo.add_variable(index)
+            # Asynchronous PDO. If one process variable changes, the data is transfered.
+            tpdo.trans_type = 254
+            # Transmit at least every event_timer milliseconds.
+            tpdo.event_timer = event_timer
+            # Minimum gap between two transmissions, in multiples of 100 microseconds.
+            tpdo.inhibit_time = inhibit_time
+            tpdo.enabled = True
+            if not self.step(self._controller, 'save TPDO{:d} configuration'.format(number), 0.2, self.save_tpdo,
+                             tpdo, rejected):
+                configured = False
+        if rejected:
+            self.poll_sdo()
+            return True
+        self.update_filters()
+        return configured
+
+    @staticmethod
+    def save_tpdo(tpdo, rejected):
+        try:
+            tpdo.save()
+        except canopen.sdo.exceptions.SdoAbortedError as e:
+            rejected.append(e)
+            raise
+
+    def poll_sdo(self):
+        """
+        Switches from TPDOs to SDO polling, the CAN filters drop the TPDOs afterwards.
+        """
+        logging.warning('The controller rejected the TPDO mapping, polling the objects over SDO instead.')
+        self._PDO = False
+        self._network.bus.set_filters(self.can_filters())
+        if not self._read_thread:
+            self._read_thread = Thread(target=self.read, name='read')
+            self._read_thread.start()
+
+    def can_filters(self):
+        return can_filters(consumed_ids(self._node_ids, self._bms_ids, self._tpdo_cob_ids if self._PDO else ()))
+
+    def update_filters(self):
+        """
+        Installs new CAN filters if the COB-IDs of the TPDOs changed.
+        """
+        # a TPDO whose configuration could not be read keeps its previous COB-ID
+        cob_ids = [self._controller.pdo.tx[tpdo[0]].cob_id or cob_id for tpdo, cob_id in zip(self._tpdos,
+                                                                                               self._tpdo_cob_ids)]
+        if cob_ids == self._tpdo_cob_ids:
+            return
+        self._tpdo_cob_ids = cob_ids
+        self._network.bus.set_filters(self.can_filters())
+        logging.info('CAN filters updated for TPDO COB-IDs ' + ', '.join('0x{:x}'.format(cob_id) for cob_id in cob_ids))
+
+    def ignore(self, value, timestamp=None):
+        pass
 
-    def received(self, message):
-        for var in message:
-            self.show_data(var.raw)
+    def received(self, handlers, message):
+        for var, handler in zip(message, handlers):
+            handler(var.raw, message.timestamp)
 
-    def show_data(self, value):
-        logging.debug('Throttle_Command: ' + str(value))
-        self._received_data = True
+    def show_data(self, value, timestamp=None):
+        logging.debug('Throttle_Command: %s', value)
+        if timestamp is None:
+            timestamp = time.time()
+        self._liveness.seen('throttle', timestamp)
+        force = self._mapping.map(value)
+        self._telemetry.record('throttle', timestamp, value)
+        self._telemetry.record('force', timestamp, force)
         if self._display:
-            self._display.set_measure(value)
-            self._display.set_torque(self._mapping.map(value))
+            self._display.set_force(value, self._force_filter.filter(force), timestamp)
 
-    def show_rpm(self, value):
+    def show_rpm(self, value, timestamp=None):
         if value > 32767:
             value -= 65536
-        logging.debug('RPM: ' + str(value))
-        self._received_data = True
+        logging.debug('RPM: %s', value)
+        if timestamp is None:
+            timestamp = time.time()
+        self._liveness.seen('rpm', timestamp)
         speed = RopeSpeed.calculate_speed(value)
-        logging.debug('Rope speed: ' + str(speed))
+        logging.debug('Rope speed: %s', speed)
+        self._telemetry.record('rpm', timestamp, value)
+        self._telemetry.record('rope_speed', timestamp, speed)
         if self._display:
-            self._display.set_rpm(value)
-            self._display.set_rope_speed(speed)
+            self._display.set_speed(value, speed, timestamp)
 
-    def show_motor_temperature(self, value):
+    def show_motor_temperature(self, value, timestamp=None):
         value /= 10
-        logging.debug('Motor temperature ' + str(value))
-        self._received_data = True
+        logging.debug('Motor temperature %s', value)
+        if timestamp is None:
+            timestamp = time.time()
+        self._liveness.seen('motor_temperature', timestamp)
+        self._telemetry.record('motor_temperature', timestamp, value)
         if self._display:
-            self._display.set_motor_temperature(value)
+            self._display.set_motor_temperature(value, timestamp)
 
-    def show_controller_temperature(self, value):
+    def show_controller_temperature(self, value, timestamp=None):
         value /= 10
-        logging.debug('Controller temperature ' + str(value))
-        self._received_data = True
+        logging.debug('Controller temperature %s', value)
+        if timestamp is None:
+            timestamp = time.time()
+        self._liveness.seen('controller_temperature', timestamp)
+        self._telemetry.record('controller_temperature', timestamp, value)
         if self._display:
-            self._display.set_controller_temperature(value)
+            self._display.set_controller_temperature(value, timestamp)
 
-    def show_voltage(self, value):
+    def show_voltage(self, value, timestamp=None):
         value /= 100.0
-        logging.debug('Voltage {:3.2f}V'.format(value))
+        logging.debug('Voltage %3.2fV', value)
+        if timestamp is None:
+            timestamp = time.time()
+        self._liveness.seen('controller_voltage', timestamp)
+        self._telemetry.record('controller_voltage', timestamp, value)
         if self._display:
-            self._display.set_voltage(value)
+            self._display.set_voltage(value, timestamp)
 
-    def monitor_heartbeat(self):
-        while self._run:
-            nmt_state = None
-            self._received_data = False
-            try:
-                nmt_state = self._controller.nmt.wait_for_heartbeat(1.2)
-            except canopen.nmt.NmtError as e:
-                pass
-            if nmt_state or self._received_data:
-                self.connected(True)
-            else:
-                self.connected(False)
-                break
+    def latency(self):
+        return self._latency.snapshot()
+
+    def report(self):
+        if self._scheduler:
+            self._scheduler.report()
+        self._latency.report()
+        if self._filter_monitor:
+            self._filter_monitor.report()
+        if self._throttle:
+            self._throttle.report()
+        self._emergencies.report()
 
     def connected(self, connected):
         if self._display:
             self._display.connected(connected)
-        self._heartbeat = connected
 
 
 ewa = Ewa()
@@ -273,12 +627,28 @@ def handler(signum, frame):
     ewa.stop()
 
 
+def report(signum, frame):
+    ewa.report()
+
+
 def main():
     signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGUSR1, report)
     parser = argparse.ArgumentParser(description='EWA')
     parser.add_argument('dev', metavar='<CAN device name>', help='CAN device name')
     parser.add_argument('-i', default=42, type=int, choices=range(1, 127), required=False, help='canopen Node ID')
     parser.add_argument('-d', action="store_true")
+    parser.add_argument('-P', type=float, metavar='<seconds>',
+                        help='sample the stacks of all threads for the given seconds, 0 until the end')
+    parser.add_argument('-I', default=10., type=float, metavar='<milliseconds>', help='interval of the stack samples')
+    parser.add_argument('-p', action="store_true", help='receive telemetry by PDO instead of polling SDOs')
+    parser.add_argument('-l', metavar='<directory>', help='log all telemetry samples into files in directory')
+    parser.add_argument('-s', default=16, type=int, help='maximum size of one telemetry log file in MiB')
+    parser.add_argument('-n', type=int, action='append', choices=range(1, 128),
+                        help='controller node ID, default 7, repeat for more controllers, the first one is shown')
+    parser.add_argument('-f', type=float, metavar='<Hz>',
+                        help='sample the I2C force sensor at this rate instead of using the controller throttle')
+    parser.add_argument('-b', type=int, action='append', help='BMS ID, default 1, repeat for parallel battery packs')
     args, left = parser.parse_known_args()
     sys.argv = sys.argv[:1] + left
 
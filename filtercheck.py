@@ -0,0 +1,23 @@
+import random
+import sys
+from forcefilter import ForceFilter
+
+
+def main():
+    """
+    Feeds noise, a step and a spike through the filter and checks that every output is a whole number of kilogramms.
+    """
+    generator = random.Random(1)
+    force_filter = ForceFilter()
+    samples = [100 + generator.uniform(-3, 3) for i in range(20)] + [150.5] * 10 + [400.] + [150.] * 10
+    outputs = [force_filter.filter(sample) for sample in samples]
+    wrong = [output for output in outputs if not isinstance(output, int)]
+    if wrong:
+        print('Not whole kilogramms: {!r}'.format(wrong))
+        return 1
+    print(' '.join('{:d}'.format(output) for output in outputs))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
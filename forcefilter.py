@@ -0,0 +1,100 @@
+import bisect
+
+# Defaults for 10 force samples per second. The median delays a step by (MEDIAN_WINDOW - 1) / 2 samples, 100ms. The EMA
+# reaches 90% of a step after log(0.1) / log(1 - EMA_ALPHA) samples, 200ms with 0.7, but follows a jump of more than
+# SPIKE kilogramms at once. The deadband adds no delay, it only hides changes smaller than DEADBAND kilogramms.
+MEDIAN_WINDOW = 3
+EMA_ALPHA = 0.7
+SPIKE = 20.
+DEADBAND = 1.
+
+
+class Median(object):
+    """
+    Median of the last window samples. The samples are kept in a ring and in a sorted list of the same fixed size, a
+    new sample replaces the oldest one in both, which costs O(window) for a window of a few samples.
+    """
+
+    def __init__(self, window=MEDIAN_WINDOW):
+        self._window = window
+        self._ring = [None] * window
+        self._sorted = []
+        self._next = 0
+
+    def __call__(self, value):
+        oldest = self._ring[self._next]
+        if oldest is not None:
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._ring[self._next] = value
+        self._next = (self._next + 1) % self._window
+        bisect.insort(self._sorted, value)
+        return self._sorted[len(self._sorted) // 2]
+
+    def reset(self):
+        self._ring = [None] * self._window
+        self._sorted = []
+        self._next = 0
+
+
+class Ema(object):
+    """
+    Exponential moving average, which jumps to the sample if it differs by more than spike from the average. So a
+    tension spike is shown at once instead of being smoothed away.
+    """
+
+    def __init__(self, alpha=EMA_ALPHA, spike=SPIKE):
+        self._alpha = alpha
+        self._spike = spike
+        self._average = None
+
+    def __call__(self, value):
+        if self._average is None or abs(value - self._average) > self._spike:
+            self._average = value
+        else:
+            self._average += self._alpha * (value - self._average)
+        return self._average
+
+    def reset(self):
+        self._average = None
+
+
+class Deadband(object):
+    """
+    Keeps the output until the input moved more than width away from it. Noise around a constant force does not
+    change the output and so does not redraw the gauge.
+    """
+
+    def __init__(self, width=DEADBAND):
+        self._width = width
+        self._output = None
+
+    def __call__(self, value):
+        if self._output is None or abs(value - self._output) > self._width:
+            self._output = value
+        return self._output
+
+    def reset(self):
+        self._output = None
+
+
+class ForceFilter(object):
+    """
+    Filters the force samples in the given stages, the median first to remove single outliers, then the EMA and the
+    deadband. Every stage keeps only a fixed amount of state. The output is rounded to whole kilogramms as the display
+    shows them.
+    """
+
+    def __init__(self, stages=None):
+        if stages is None:
+            stages = (Median(), Ema(), Deadband())
+        self._stages = stages
+
+    def filter(self, value):
+        for stage in self._stages:
+            value = stage(value)
+        return int(round(value))
+
+    def reset(self):
+        for stage in self._stages:
+            stage.reset()
+
@@ -1,9 +1,14 @@
 import bisect
 import json
 import logging
+import operator
 import os.path
+from array import array
 from collections import OrderedDict
 
+# Throttle_Command is a 16 bit value, every possible raw value gets a precomputed force.
+TABLE_SIZE = 65536
+
 
 # TODO 'KeysView' object does not support indexing
 class ForceMapping(object):
@@ -11,6 +16,7 @@ class ForceMapping(object):
         self._map = dict(
             [(0, 0), (50, 5826), (60, 6783), (70, 7209), (80, 8177), (90, 8816), (100, 9498), (130, 11469)])
         self._reverse = self.reverse(self._map)
+        self._table = self.compile(self._reverse)
 
     def configure(self, key, value):
         if key in self._map:
@@ -18,6 +24,7 @@ class ForceMapping(object):
         else:
             raise Exception('No such key ' + key)
         self._reverse = self.reverse(self._map)
+        self._table = self.compile(self._reverse)
 
     def get(self, key):
         try:
@@ -35,27 +42,68 @@ class ForceMapping(object):
         if os.path.isfile("mapping.json"):
             with open("mapping.json", "r") as file:
                 # TODO catch read problem
-                self._map = json.load(file)
-            for key in self._map:
-                self._map[int(key)] = self._map.pop(key)
+                self._map = dict((int(key), value) for key, value in json.load(file).items())
             self._reverse = self.reverse(self._map)
+            self._table = self.compile(self._reverse)
 
     @staticmethod
     def reverse(omap):
         return OrderedDict(sorted([(t[1], t[0]) for t in omap.items()], key=lambda t: t[0]))
 
+    @staticmethod
+    def compile(reverse):
+        """
+        Interpolates the force for every raw value between 0 and TABLE_SIZE once, so that mapping a sample is a
+        single index operation.
+        """
+        keys = list(reverse.keys())
+        table = array('i', [0]) * TABLE_SIZE
+        for pos in range(1, len(keys)):
+            key1 = keys[pos - 1]
+            key2 = keys[pos]
+            value1 = reverse[key1]
+            value2 = reverse[key2]
+            pitch = float(value2 - value1) / float(key2 - key1)
+            # the first and last segment are extrapolated to the ends of the table
+            start = 0 if 1 == pos else max(key1, 0)
+            stop = TABLE_SIZE if len(keys) - 1 == pos else min(key2, TABLE_SIZE)
+            if start < stop:
+                table[start:stop] = array('i', [int(pitch * (value - key1) + value1) for value in range(start, stop)])
+        for key in keys:
+            if 0 <= key < TABLE_SIZE:
+                table[key] = reverse[key]
+        return table
+
     def map(self, value):
+        if 0 <= value < TABLE_SIZE:
+            return self._table[value]
+        return self.interpolate(value)
+
+    def map_many(self, values):
+        """
+        Maps a sequence of raw values at once, e.g. for processing logs. Returns an array of forces.
+        """
+        if not values:
+            return array('i')
+        if 0 <= min(values) and max(values) < TABLE_SIZE:
+            if 1 == len(values):
+                return array('i', [self._table[values[0]]])
+            return array('i', operator.itemgetter(*values)(self._table))
+        return array('i', [self.map(value) for value in values])
+
+    def interpolate(self, value):
         if value in self._reverse:
             return self._reverse[value]
-        length = len(self._reverse)
-        pos = bisect.bisect_left(list(self._reverse.keys()), value)
+        keys = list(self._reverse.keys())
+        length = len(keys)
+        pos = bisect.bisect_left(keys, value)
         if length == pos:
             pos = length - 1
 
         elif 0 == pos:
             pos = 1
-        key1 = list(self._reverse.keys())[pos - 1]
-        key2 = list(self._reverse.keys())[pos]
+        key1 = keys[pos - 1]
+        key2 = keys[pos]
         value1 = self._reverse[key1]
         value2 = self._reverse[key2]
         pitch = float(value2 - value1) / float(key2 - key1)
@@ -1,13 +1,20 @@
 import inspect
+import math
 import os
 import logging
 import traceback
+from kivy.clock import Clock
+from kivy.core.image import Image as CoreImage
+from kivy.graphics import (
+    PopMatrix,
+    PushMatrix,
+    Rectangle,
+    Rotate
+)
 from kivy.properties import BoundedNumericProperty
 from kivy.properties import NumericProperty
 from kivy.properties import StringProperty
-from kivy.uix.image import Image
 from kivy.uix.widget import Widget
-from kivy.uix.scatter import Scatter
 
 
 class DummyClass:
@@ -18,61 +25,81 @@ class Gauge(Widget):
     _dummy = DummyClass
     _unit = NumericProperty(1.2)
     _value = BoundedNumericProperty(0, min=0, max=150, errorvalue=0)
+    # speed in 1/s the needle follows a new value with, 0 lets it jump
+    _damping = NumericProperty(12.)
     _mypath = os.path.dirname(os.path.abspath(inspect.getsourcefile(_dummy)))
     _file_gauge = StringProperty(_mypath + os.sep + 'kilogramms.png')
     _file_needle = StringProperty(_mypath + os.sep + 'needle.png')
+    _textures = {}
 
     def __init__(self, **kwargs):
         super(Gauge, self).__init__(**kwargs)
-
-        self._scat_gauge = Scatter(do_scale=False, do_translation=False, do_rotation=False)
-        self._img_gauge = Image(source=self._file_gauge)
-
-        self._scat_needle = Scatter(do_scale=False, do_translation=False, do_rotation=False)
-        self._img_needle = Image(source=self._file_needle)
-
-        self._scat_gauge.add_widget(widget=self._img_gauge)
-        self.add_widget(widget=self._scat_gauge)
-
-        self._scat_needle.add_widget(widget=self._img_needle)
-        self.add_widget(widget=self._scat_needle)
+        self._angle = self._target_angle()
+        self._animation = None
+        with self.canvas:
+            self._gauge = Rectangle(texture=self.texture(self._file_gauge))
+            PushMatrix()
+            self._rotate = Rotate(angle=self._angle)
+            self._needle = Rectangle(texture=self.texture(self._file_needle))
+            PopMatrix()
 
         self.bind(pos=self._update)
         self.bind(size=self._update)
         self.bind(_value=self._turn)
 
+    @classmethod
+    def texture(cls, path):
+        """
+        Loads every image only once, all gauges share the textures.
+        """
+        texture = cls._textures.get(path)
+        if texture is None:
+            texture = CoreImage(path).texture
+            cls._textures[path] = texture
+        return texture
+
+    def _target_angle(self):
+        return 90 - (self._value * self._unit)
+
     def _update(self, *args):
         try:
             # images are 1024 x 1024, but only top 552 pixels contain the gauge
             height = min(self.height, self.width * 552 / 1024)
             width = min(self.width, self.height * 1024 / 552)
 
-            # modify size first otherwise center placing is done with old size
-            self._scat_gauge.size = (width, width)
-            self._scat_gauge.center = (self.center_x, self.y + height - width / 2)
-            # image positioning relative to scat_gauge and not to window and again first size to have correct center
-            # positioning
-            self._img_gauge.size = self._scat_gauge.size
-            self._img_gauge.center = (self._scat_gauge.width / 2, self._scat_gauge.height / 2)
-
-            self._scat_needle.size = self._scat_gauge.size
-            self._scat_needle.center = self._scat_gauge.center
-            self._img_needle.size = self._scat_needle.size
-            self._img_needle.center = (self._scat_needle.width / 2, self._scat_needle.height / 2)
-            self._turn()
+            pos = (self.center_x - width / 2, self.y + height - width)
+            self._gauge.pos = pos
+            self._gauge.size = (width, width)
+            self._needle.pos = pos
+            self._needle.size = (width, width)
+            self._rotate.origin = (self.center_x, self.y + height - width / 2)
         except BaseException as e:
             logging.error(traceback.format_exc())
 
     def _turn(self, *args):
         try:
-            self._scat_needle.rotation = 90 - (self._value * self._unit)
+            if self._damping <= 0:
+                self._angle = self._target_angle()
+                self._rotate.angle = self._angle
+            elif self._animation is None:
+                # follow the value once per frame until the needle reached it
+                self._animation = Clock.schedule_interval(self._animate, 0)
         except BaseException as e:
             logging.error(traceback.format_exc())
 
+    def _animate(self, dt):
+        target = self._target_angle()
+        self._angle += (target - self._angle) * (1. - math.exp(-self._damping * dt))
+        if abs(target - self._angle) < 0.05:
+            self._angle = target
+            self._animation = None
+            self._rotate.angle = self._angle
+            return False
+        self._rotate.angle = self._angle
+
     def set_value(self, value):
         try:
             self._value = value
-            self._turn()
         except BaseException as e:
             logging.error(traceback.format_exc())
 
@@ -0,0 +1,86 @@
+import bisect
+import logging
+
+# Upper bounds of the histogram buckets in seconds, from 100 microseconds to about 13 seconds in steps of sqrt(2).
+BOUNDS = [0.0001 * 2 ** (i / 2.) for i in range(35)]
+RECEIVE = 'receive-decode'
+DISPLAY = 'decode-ui'
+AGE = 'age'
+# delay between a signal missing its deadline and noticing it
+DETECTION = 'stale-detection'
+
+
+class Histogram(object):
+    """
+    Latency histogram with fixed logarithmic buckets, their upper bounds in ascending order. Recording a value costs
+    one bisection and no allocation.
+    """
+
+    def __init__(self, bounds=BOUNDS):
+        self._bounds = bounds
+        self._buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.
+        self.maximum = 0.
+
+    def record(self, value):
+        self._buckets[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, share):
+        """
+        Upper bound of the bucket containing the given share of all values.
+        """
+        if 0 == self.count:
+            return None
+        limit = share * self.count
+        seen = 0
+        for index, count in enumerate(self._buckets):
+            seen += count
+            if seen >= limit:
+                return min(self._bounds[index], self.maximum) if index < len(self._bounds) else self.maximum
+        return self.maximum
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class LatencyMonitor(object):
+    """
+    Histograms per signal of the latency from receiving a sample to decoding it, from decoding it to pushing it into a
+    widget and of the age of the sample at that moment.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+
+    def record(self, signal, stage, value):
+        try:
+            histogram = self._histograms[(signal, stage)]
+        except KeyError:
+            histogram = self._histograms.setdefault((signal, stage), Histogram())
+        histogram.record(value)
+
+    def histogram(self, signal, stage):
+        return self._histograms.get((signal, stage))
+
+    def snapshot(self):
+        """
+        Returns count, mean, p50, p99 and maximum in seconds of every signal and stage.
+        """
+        result = {}
+        for (signal, stage), histogram in sorted(self._histograms.items()):
+            result.setdefault(signal, {})[stage] = {
+                'count': histogram.count, 'mean': histogram.mean(), 'p50': histogram.percentile(.5),
+                'p99': histogram.percentile(.99), 'max': histogram.maximum}
+        return result
+
+    def report(self):
+        for signal, stages in sorted(self.snapshot().items()):
+            for stage, values in sorted(stages.items()):
+                logging.info('{:s} {:s}: {:d} samples, mean {:.1f}ms, p50 <{:.1f}ms, p99 <{:.1f}ms, '
+                             'max {:.1f}ms'.format(signal, stage, values['count'], values['mean'] * 1000,
+                                                   values['p50'] * 1000, values['p99'] * 1000, values['max'] * 1000))
@@ -0,0 +1,56 @@
+class Liveness(object):
+    """
+    Tracks when heartbeats and telemetry signals were received last. seen() only stores a timestamp and may be called
+    from any thread. A single timer calls check() at next_check() to find the signals that missed their deadline.
+    """
+
+    def __init__(self):
+        self._deadlines = {}
+        self._seen = {}
+        self._stale = set()
+
+    def watch(self, name, deadline):
+        """
+        A signal not received for deadline seconds becomes stale.
+        """
+        self._deadlines[name] = deadline
+
+    def seen(self, name, timestamp):
+        self._seen[name] = timestamp
+
+    def alive(self, name, now):
+        last = self._seen.get(name)
+        return last is not None and now - last <= self._deadlines[name]
+
+    def stale(self):
+        return set(self._stale)
+
+    def next_check(self):
+        """
+        The earliest time a signal that is alive now can become stale, None if no signal is alive.
+        """
+        result = None
+        for name, last in list(self._seen.items()):
+            if name in self._stale:
+                continue
+            expiry = last + self._deadlines[name]
+            if result is None or expiry < result:
+                result = expiry
+        return result
+
+    def check(self, now):
+        """
+        Returns the signals that became stale with the delay between their expiry and now, and the recovered signals.
+        """
+        stale = []
+        recovered = []
+        for name, last in list(self._seen.items()):
+            expiry = last + self._deadlines[name]
+            if now > expiry:
+                if name not in self._stale:
+                    self._stale.add(name)
+                    stale.append((name, now - expiry))
+            elif name in self._stale:
+                self._stale.discard(name)
+                recovered.append(name)
+        return stale, recovered
@@ -1,18 +1,200 @@
-import time
+import argparse
 import can
+import glob
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
 
+MAGIC = b'EWACAN01'
+# d:timestamp I:arbitration ID B:DLC B:flags 2x:padding 8s:data
+RECORD = struct.Struct('<dIBB2x8s')
+EXTENDED = 0x01
+REMOTE = 0x02
+ERROR = 0x04
 
-def main():
-    bus = can.interface.Bus('can0', bustype='socketcan')
-    logger = can.Logger(None)
-    notifier = can.Notifier(bus, [logger], timeout=0.1)
 
+class Recorder(can.Listener):
+    """
+    Writes every received frame as a fixed size record into trace files in directory. A new file is started when the
+    current one exceeds max_size bytes, only the newest keep files are retained if keep is not 0.
+    """
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024, keep=0):
+        super(Recorder, self).__init__()
+        self._directory = directory
+        self._max_size = max_size
+        self._keep = keep
+        self._file = None
+        self._size = 0
+        self._sequence = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._files = sorted(glob.glob(os.path.join(directory, 'can-*.bin')))
+
+    def _rotate(self):
+        if self._file:
+            self._file.close()
+        prefix = os.path.join(self._directory, time.strftime('can-%Y%m%d-%H%M%S', time.localtime()))
+        path = prefix + '-{:03d}.bin'.format(self._sequence)
+        while os.path.exists(path):
+            self._sequence += 1
+            path = prefix + '-{:03d}.bin'.format(self._sequence)
+        self._sequence += 1
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        self._files.append(path)
+        while 0 < self._keep < len(self._files):
+            try:
+                os.remove(self._files.pop(0))
+            except OSError:
+                logging.exception('Failed to remove old trace file.')
+
+    def on_message_received(self, msg):
+        if self._file is None or self._size >= self._max_size:
+            self._rotate()
+        flags = (EXTENDED if msg.is_extended_id else 0) | (REMOTE if msg.is_remote_frame else 0) | \
+                (ERROR if msg.is_error_frame else 0)
+        self._file.write(RECORD.pack(msg.timestamp, msg.arbitration_id, msg.dlc, flags, bytes(msg.data)))
+        self._size += RECORD.size
+
+    def stop(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class TraceReader(object):
+    """
+    Memory mapped access to the records of one trace file. A record cut off by a power loss at the end is ignored.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('Not a CAN trace file: ' + path)
+        self._count = (len(self._map) - len(MAGIC)) // RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """
+        Returns timestamp, arbitration ID, DLC, flags and data of the record with the given index.
+        """
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return RECORD.unpack_from(self._map, len(MAGIC) + index * RECORD.size)
+
+    def __iter__(self):
+        for index in range(self._count):
+            timestamp, can_id, dlc, flags, data = RECORD.unpack_from(self._map, len(MAGIC) + index * RECORD.size)
+            yield can.Message(timestamp=timestamp, arbitration_id=can_id, is_extended_id=bool(flags & EXTENDED),
+                              is_remote_frame=bool(flags & REMOTE), is_error_frame=bool(flags & ERROR), dlc=dlc,
+                              data=data[:dlc])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def notify(listeners):
+    """
+    Returns a send function for replay() that hands the frames directly to the listeners, e.g. a
+    canopen.network.MessageListener and a BMSListener, without any bus in between.
+    """
+    def send(msg):
+        for listener in listeners:
+            listener.on_message_received(msg)
+    return send
+
+
+def replay(paths, send, speed=1., running=lambda: True):
+    """
+    Replays the trace files in the given order through send, which can be the send method of a bus or the result of
+    notify(). speed 1 keeps the recorded timing, 10 is ten times faster and 0 sends as fast as possible. Returns the
+    number of replayed frames.
+    """
+    count = 0
+    first = None
+    start = None
+    for path in paths:
+        reader = TraceReader(path)
+        try:
+            for msg in reader:
+                if not running():
+                    return count
+                if speed > 0:
+                    if first is None:
+                        first = msg.timestamp
+                        start = time.time()
+                    delay = start + (msg.timestamp - first) / speed - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                send(msg)
+                count += 1
+        finally:
+            reader.close()
+    return count
+
+
+def record(args):
+    bus = can.interface.Bus(args.dev, bustype='socketcan')
+    listeners = [Recorder(args.directory, args.s * 1024 * 1024, args.k)]
+    if args.p:
+        listeners.append(can.Logger(None))
+    notifier = can.Notifier(bus, listeners, timeout=0.1)
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         print('Shutdown')
+        notifier.stop()
+        for listener in listeners:
+            listener.stop()
         bus.shutdown()
 
+
+def play(args):
+    bus = can.interface.Bus(args.dev, bustype=args.b)
+    try:
+        start = time.time()
+        count = replay(args.files, bus.send, args.x)
+        print('Replayed {:d} frames in {:.1f}s'.format(count, time.time() - start))
+    except KeyboardInterrupt:
+        print('Shutdown')
+    finally:
+        bus.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CAN trace recorder and replay')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    recorder = commands.add_parser('record', help='record all frames of a CAN device')
+    recorder.add_argument('dev', metavar='<CAN device name>', help='CAN device name')
+    recorder.add_argument('directory', help='directory for the trace files')
+    recorder.add_argument('-s', default=64, type=int, help='maximum size of one trace file in MiB')
+    recorder.add_argument('-k', default=0, type=int, help='number of trace files to keep, 0 keeps all')
+    recorder.add_argument('-p', action="store_true", help='print the frames too')
+    player = commands.add_parser('replay', help='send recorded frames to a CAN device')
+    player.add_argument('dev', metavar='<CAN device name>', help='CAN device name, e.g. a vcan device')
+    player.add_argument('files', nargs='+', help='trace files in replay order')
+    player.add_argument('-x', default=1., type=float, help='speed factor, 0 replays as fast as possible')
+    player.add_argument('-b', default='socketcan', help='python-can bus type')
+    args = parser.parse_args()
+    logging.basicConfig()
+    if 'replay' == args.command:
+        play(args)
+    else:
+        record(args)
+    return 0
+
+
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import canopen
+import hashlib
+import logging
+import os
+import pickle
+from canopen import objectdictionary
+
+# Objects EWA accesses: producer heartbeat time, TPDO communication and mapping parameters, the scope variables and the
+# controller objects read over SDO or mapped into TPDOs.
+OBJECTS = [0x1017, 0x2110, 0x3207, 0x320b, 0x3216, 0x322a, 0x324d] + list(range(0x1800, 0x1c00))
+SUFFIX = '.cache'
+
+
+def key(content):
+    """
+    Changes with the EDS, the cached objects and the canopen version, which pickled the objects.
+    """
+    digest = hashlib.sha1(content)
+    digest.update(repr((OBJECTS, getattr(canopen, '__version__', ''))).encode('ascii'))
+    return digest.hexdigest()
+
+
+def reduce(full):
+    """
+    Returns a new object dictionary with only those OBJECTS the full one contains.
+    """
+    result = objectdictionary.ObjectDictionary()
+    result.bitrate = full.bitrate
+    result.node_id = full.node_id
+    for index in OBJECTS:
+        if index in full:
+            result.add_object(full[index])
+    return result
+
+
+def load(path, node_id):
+    """
+    Returns the object dictionary of the EDS at path reduced to OBJECTS. The first start after the EDS changed parses
+    it and stores the result next to it, every other start just unpickles the stored result. Every node ID has its own
+    cache, as the defaults of $NODEID objects like the PDO COB-IDs are resolved while parsing.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    prefix = path + '.'
+    current = prefix + key(content) + '.'
+    cache = current + str(node_id) + SUFFIX
+    try:
+        with open(cache, 'rb') as f:
+            return pickle.load(f)
+    except (IOError, OSError):
+        pass
+    except Exception:
+        logging.exception('Reading ' + cache + ' failed')
+    result = reduce(objectdictionary.import_od(path, node_id))
+    store(result, cache, prefix, current)
+    return result
+
+
+def store(od, cache, prefix, current):
+    """
+    Removes the caches of other versions of the EDS, those of the other nodes with the current one are kept.
+    """
+    directory = os.path.dirname(os.path.abspath(cache))
+    for name in os.listdir(directory):
+        stale = os.path.join(directory, name)
+        if stale.startswith(os.path.abspath(prefix)) and not stale.startswith(os.path.abspath(current)) and \
+                name.endswith(SUFFIX):
+            os.remove(stale)
+    # written to a temporary file first, an interrupted start must not leave a truncated cache
+    try:
+        with open(cache + '.tmp', 'wb') as f:
+            pickle.dump(od, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(cache + '.tmp', cache)
+    except (IOError, OSError):
+        logging.exception('Writing ' + cache + ' failed')
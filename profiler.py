@@ -0,0 +1,126 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+# innermost functions of a thread blocked in Python code, used where the scheduler state of threads is unknown
+WAITS = frozenset(('threading.py:wait', 'threading.py:_wait_for_tstate_lock', 'queue.py:get', 'selectors.py:select'))
+IDLE = '(idle)'
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stacks of all threads every interval seconds for duration seconds, or until stop() if duration is 0.
+    Nothing is traced between the samples, so the profiled threads do not slow down. A sample of a thread not running
+    counts as idle: on Linux its scheduler state tells, which also covers sleeps and reads in C functions, elsewhere
+    only waits in the WAITS functions are recognized.
+    """
+
+    def __init__(self, interval=0.01, duration=0):
+        self._interval = interval
+        self._duration = duration
+        # thread name, stack, the outermost function first, and whether idle to number of samples
+        self._stacks = collections.Counter()
+        self._labels = {}
+        self.samples = 0
+        self._run = False
+        self._thread = None
+
+    def start(self):
+        self._run = True
+        self._thread = threading.Thread(target=self.sample, name='profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._run = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def label(self, code):
+        try:
+            return self._labels[code]
+        except KeyError:
+            label = '{:s}:{:s}'.format(os.path.basename(code.co_filename), code.co_name)
+            self._labels[code] = label
+            return label
+
+    @staticmethod
+    def running(native_id):
+        """
+        Whether the thread is running or ready to run, None if unknown.
+        """
+        if native_id is None:
+            return None
+        try:
+            with open('/proc/self/task/{:d}/stat'.format(native_id)) as f:
+                stat = f.read()
+        except (IOError, OSError):
+            return None
+        # the state follows the command in parentheses
+        return 'R' == stat[stat.rindex(')') + 2]
+
+    def sample(self):
+        own = threading.current_thread().ident
+        end = time.time() + self._duration if self._duration > 0 else None
+        deadline = time.time()
+        while self._run and (end is None or deadline < end):
+            threads = dict((thread.ident, thread) for thread in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self.label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                thread = threads.get(ident)
+                running = self.running(getattr(thread, 'native_id', None))
+                if running is None:
+                    running = not stack or stack[-1] not in WAITS
+                self._stacks[(thread.name if thread else str(ident), tuple(stack), not running)] += 1
+            self.samples += 1
+            deadline += self._interval
+            delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.time()
+
+    def threads(self):
+        """
+        Returns per thread the number of samples, the idle ones and of the others the samples per innermost function and
+        per function on the stack.
+        """
+        result = {}
+        for (name, stack, idle), count in self._stacks.items():
+            values = result.setdefault(name, [0, 0, collections.Counter(), collections.Counter()])
+            total, idle_count, own, inclusive = values
+            values[0] = total + count
+            if idle:
+                values[1] = idle_count + count
+                continue
+            if stack:
+                own[stack[-1]] += count
+            for label in set(stack):
+                inclusive[label] += count
+        return result
+
+    def report(self, top=10):
+        for name, (total, idle, own, inclusive) in sorted(self.threads().items()):
+            logging.info('Thread {:s}: {:d} samples, {:.1f}% idle'.format(name, total, idle * 100. / total))
+            for label, count in own.most_common(top):
+                logging.info('  {:5.1f}% own {:5.1f}% total {:s}'.format(count * 100. / total,
+                                                                         inclusive[label] * 100. / total, label))
+
+    def write(self, path):
+        """
+        Writes the stacks in the collapsed format of flamegraph.pl, the thread name as outermost frame and IDLE as
+        innermost one of idle samples.
+        """
+        with open(path, 'w') as f:
+            for (name, stack, idle), count in sorted(self._stacks.items()):
+                f.write('{:s} {:d}\n'.format(';'.join((name,) + stack + ((IDLE,) if idle else ())), count))
@@ -0,0 +1,146 @@
+import logging
+import time
+from canopen.sdo.exceptions import (
+    SdoCommunicationError,
+    SdoError
+)
+
+# Deadlines must not move with the wall clock, the Pi steps it when NTP synchronizes. Python 2 has no monotonic clock.
+clock = getattr(time, 'monotonic', time.time)
+
+
+class PollObject(object):
+    """
+    One object dictionary entry polled over SDO with its own period and priority. Lower priority values are served
+    first when several objects are due at the same time. An object waiting for longer than its period ages: every
+    period it is overdue counts like one priority level more, so slow reads of urgent objects cannot starve the others.
+    """
+
+    def __init__(self, name, index, handler, period, priority):
+        self.name = name
+        self.index = index
+        self.handler = handler
+        self.period = period
+        self.priority = priority
+        self.backoff = 1
+        self.deadline = 0.
+        self.last = None
+        self.reads = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.interval = period
+        self.jitter = 0.
+
+    def effective_period(self):
+        return self.period * self.backoff
+
+    def urgency(self, now):
+        """
+        The lower the more urgent.
+        """
+        return self.priority - (now - self.deadline) / self.effective_period()
+
+    def rate(self):
+        return 1. / self.interval if self.interval > 0 else 0.
+
+
+class PollScheduler(object):
+    """
+    Deadline ordered SDO poller. Every object is read when its deadline passes. Deadlines missed by more than a whole
+    period are not caught up but skipped, so a slow object never causes a burst of reads that block the fast ones.
+    SDO timeouts double the period of the affected object up to max_backoff times, a successful read restores it.
+    """
+    # weight of a new sample in the running interval and jitter averages
+    _ALPHA = 0.1
+
+    def __init__(self, read, log_errors=True, max_backoff=16):
+        self._read = read
+        self._log_errors = log_errors
+        self._max_backoff = max_backoff
+        self._objects = []
+
+    def add(self, name, index, handler, period, priority=0):
+        self._objects.append(PollObject(name, index, handler, period, priority))
+
+    def reset(self):
+        now = clock()
+        for obj in self._objects:
+            obj.backoff = 1
+            obj.deadline = now
+            obj.last = None
+
+    def next_due(self, now):
+        due = None
+        due_urgency = None
+        for obj in self._objects:
+            if obj.deadline > now:
+                continue
+            urgency = obj.urgency(now)
+            if due is None or urgency < due_urgency:
+                due = obj
+                due_urgency = urgency
+        return due
+
+    def poll_once(self):
+        """
+        Reads the most urgent due object. Returns the time in seconds until the next deadline.
+        """
+        now = clock()
+        obj = self.next_due(now)
+        if obj:
+            self._poll(obj)
+            now = clock()
+        return max(0., min(o.deadline for o in self._objects) - now)
+
+    def _poll(self, obj):
+        try:
+            value = self._read(obj.index)
+        except SdoCommunicationError:
+            obj.timeouts += 1
+            obj.backoff = min(obj.backoff * 2, self._max_backoff)
+            if self._log_errors:
+                logging.exception('Reading ' + obj.name + ' failed')
+        except SdoError:
+            if self._log_errors:
+                logging.exception('Reading ' + obj.name + ' failed')
+        else:
+            self._account(obj, clock())
+            obj.backoff = 1
+            # the handlers get the wall clock time like received PDOs
+            obj.handler(value, time.time())
+        period = obj.effective_period()
+        obj.deadline += period
+        now = clock()
+        if obj.deadline + period < now:
+            missed = int((now - obj.deadline) / period)
+            obj.skipped += missed
+            obj.deadline += missed * period
+
+    def _account(self, obj, now):
+        obj.reads += 1
+        if obj.last is not None:
+            interval = now - obj.last
+            obj.interval += self._ALPHA * (interval - obj.interval)
+            # against the period stretched by a timeout before
+            obj.jitter += self._ALPHA * (abs(interval - obj.effective_period()) - obj.jitter)
+        obj.last = now
+
+    def run(self, running, max_sleep=0.1):
+        """
+        Polls until running() returns False. Sleeps at most max_sleep seconds at once to notice the stop request.
+        """
+        self.reset()
+        while running():
+            wait = self.poll_once()
+            if wait > 0:
+                time.sleep(min(wait, max_sleep))
+
+    def statistics(self):
+        return dict((obj.name, {'period': obj.period, 'rate': obj.rate(), 'jitter': obj.jitter, 'reads': obj.reads,
+                                'timeouts': obj.timeouts, 'skipped': obj.skipped}) for obj in self._objects)
+
+    def report(self):
+        for obj in self._objects:
+            logging.info('{:s}: target {:.1f}Hz, actual {:.1f}Hz, jitter {:.1f}ms, reads {:d}, timeouts {:d}, '
+                         'skipped {:d}'.format(obj.name, 1. / obj.period, obj.rate(), obj.jitter * 1000, obj.reads,
+                                               obj.timeouts, obj.skipped))
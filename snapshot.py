@@ -0,0 +1,90 @@
+import threading
+import time
+
+FIELDS = ('connected', 'measure', 'torque', 'rpm', 'rope_speed', 'motor_temperature', 'controller_temperature',
+          'battery_voltage', 'battery_level', 'min_cell', 'cells')
+
+
+class Snapshot(object):
+    """
+    Values of all displayed fields at one moment. min_cell is a tuple of address and voltage of the lowest cell, cells
+    the CellStats.summary() of all packs.
+    """
+    __slots__ = ('sequence',) + FIELDS
+
+    def __init__(self):
+        self.sequence = 0
+        self.connected = False
+        self.measure = 0
+        self.torque = 0
+        self.rpm = 0
+        self.rope_speed = 0
+        self.motor_temperature = 0.
+        self.controller_temperature = 0.
+        self.battery_voltage = 0.
+        self.battery_level = 0.
+        self.min_cell = (0, 0.)
+        self.cells = None
+
+    def copy(self, target):
+        for field in FIELDS:
+            setattr(target, field, getattr(self, field))
+
+
+class SnapshotBuffer(object):
+    """
+    Double buffered snapshot. The CAN threads write the values of one sample into the back buffer, swap it to the front
+    and write the values into the new back buffer, so both are equal afterwards. A sequence number per buffer is odd
+    while the buffer is written. The UI never locks, it copies the front buffer and retries if its sequence number
+    changed meanwhile.
+    """
+
+    def __init__(self):
+        self._front = Snapshot()
+        self._back = Snapshot()
+        # only the writers are serialized
+        self._lock = threading.Lock()
+
+    def publish(self, field, value):
+        """
+        Returns False without publishing if the field already has the value.
+        """
+        return bool(self.publish_all(((field, value),)))
+
+    def publish_all(self, values):
+        """
+        Publishes the field and value pairs of one sample with a single swap, so the UI sees either all of them or none.
+        Returns the fields whose value changed.
+        """
+        with self._lock:
+            back = self._back
+            changed = [(field, value) for field, value in values if getattr(back, field) != value]
+            if not changed:
+                return ()
+            back.sequence += 1
+            for field, value in changed:
+                setattr(back, field, value)
+            back.sequence += 1
+            front = self._front
+            self._front = back
+            self._back = front
+            front.sequence += 1
+            for field, value in changed:
+                setattr(front, field, value)
+            front.sequence += 1
+            return [field for field, value in changed]
+
+    def read(self, target):
+        """
+        Copies a consistent snapshot into target.
+        """
+        while True:
+            front = self._front
+            sequence = front.sequence
+            if sequence % 2:
+                # gives the writer holding the GIL a chance to finish
+                time.sleep(0)
+                continue
+            front.copy(target)
+            if front.sequence == sequence:
+                return target
@@ -0,0 +1,29 @@
+import logging
+import threading
+import time
+
+
+class Startup(object):
+    """
+    Collects the startup phases. Phases running in parallel threads are timed against the previous phase of the same
+    thread.
+    """
+
+    def __init__(self):
+        self._start = time.time()
+        self._phases = []
+        self._last = {}
+
+    def mark(self, phase):
+        now = time.time()
+        thread = threading.current_thread().name
+        duration = now - self._last.get(thread, self._start)
+        self._last[thread] = now
+        self._phases.append((phase, thread, duration, now - self._start))
+        logging.info('Startup: {:s} took {:.0f}ms, {:.0f}ms after start'.format(phase, duration * 1000,
+                                                                                 (now - self._start) * 1000))
+
+    def report(self):
+        for phase, thread, duration, elapsed in sorted(self._phases, key=lambda p: p[3]):
+            logging.info('Startup {:s}: {:s} {:.0f}ms, done after {:.0f}ms'.format(thread, phase, duration * 1000,
+                                                                                   elapsed * 1000))
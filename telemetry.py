@@ -0,0 +1,151 @@
+from array import array
+
+# Signal name and number of samples kept. Fast signals arrive about every 100 milliseconds, slow ones every second.
+SIGNALS = (
+    ('throttle', 18000),
+    ('force', 18000),
+    ('rpm', 18000),
+    ('rope_speed', 18000),
+    ('motor_temperature', 3600),
+    ('controller_temperature', 3600),
+    ('controller_voltage', 3600),
+    ('battery_voltage', 3600),
+    ('battery_current', 3600),
+    ('battery_energy', 3600),
+    ('charge_level', 3600),
+    ('min_cell_voltage', 3600),
+)
+
+
+class RingBuffer(object):
+    """
+    Fixed capacity history of timestamped samples. Storage is allocated once, the oldest sample is overwritten when
+    the buffer is full. Samples are expected in ascending time order. One thread may append while others query.
+    """
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._timestamps = array('d', [0.]) * capacity
+        self._values = array('d', [0.]) * capacity
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        position = self._next
+        self._timestamps[position] = timestamp
+        self._values[position] = value
+        self._next = (position + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+
+    def last(self):
+        if 0 == self._count:
+            return None
+        position = (self._next - 1) % self._capacity
+        return self._timestamps[position], self._values[position]
+
+    def _slices(self, start, count, next_position):
+        """
+        Physical index ranges holding count samples beginning with the logical index start, at most two.
+        """
+        first = (next_position - count + start) % self._capacity
+        end = first + count - start
+        if end <= self._capacity:
+            return [(first, end)]
+        return [(first, self._capacity), (0, end - self._capacity)]
+
+    def _bisect(self, timestamp, count, next_position):
+        """
+        Logical index of the first sample not older than timestamp.
+        """
+        low = 0
+        high = count
+        oldest = next_position - count
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamps[(oldest + middle) % self._capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, seconds, now=None):
+        """
+        Returns arrays of the timestamps and values of all samples not older than seconds before now. now defaults to
+        the timestamp of the newest sample.
+        """
+        count = self._count
+        next_position = self._next
+        if 0 == count:
+            return array('d'), array('d')
+        if now is None:
+            now = self._timestamps[(next_position - 1) % self._capacity]
+        first = self._bisect(now - seconds, count, next_position)
+        timestamps = array('d')
+        values = array('d')
+        for start, end in self._slices(first, count, next_position):
+            timestamps.extend(self._timestamps[start:end])
+            values.extend(self._values[start:end])
+        return timestamps, values
+
+    def minimum(self, seconds, now=None):
+        values = self.window(seconds, now)[1]
+        return min(values) if values else None
+
+    def maximum(self, seconds, now=None):
+        values = self.window(seconds, now)[1]
+        return max(values) if values else None
+
+    def mean(self, seconds, now=None):
+        values = self.window(seconds, now)[1]
+        return sum(values) / len(values) if values else None
+
+    def downsample(self, seconds, buckets, now=None):
+        """
+        Averages the samples of the window into equally long time buckets, e.g. for drawing a trend chart. Returns a
+        list of (bucket start, mean) tuples, empty buckets are left out.
+        """
+        timestamps, values = self.window(seconds, now)
+        if not values:
+            return []
+        if now is None:
+            now = timestamps[-1]
+        start = now - seconds
+        width = float(seconds) / buckets
+        result = []
+        bucket = None
+        total = 0.
+        count = 0
+        for timestamp, value in zip(timestamps, values):
+            index = min(int((timestamp - start) / width), buckets - 1)
+            if index != bucket:
+                if count:
+                    result.append((start + bucket * width, total / count))
+                bucket = index
+                total = 0.
+                count = 0
+            total += value
+            count += 1
+        result.append((start + bucket * width, total / count))
+        return result
+
+
+class Telemetry(object):
+    """
+    History of every telemetry signal of the winch. Every sample is written to the optional TelemetryLog too.
+    """
+
+    def __init__(self, log=None):
+        self._signals = dict((name, RingBuffer(capacity)) for name, capacity in SIGNALS)
+        self.log = log
+
+    def __getitem__(self, name):
+        return self._signals[name]
+
+    def record(self, name, timestamp, value):
+        self._signals[name].append(timestamp, value)
+        if self.log:
+            self.log.record(name, timestamp, value)
@@ -0,0 +1,127 @@
+import glob
+import logging
+import os
+import struct
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+MAGIC = b'EWATLM01'
+# H:length of the signal names following the magic, which are separated by commas
+HEADER = struct.Struct('<H')
+# d:timestamp d:value H:signal index 6x:padding
+RECORD = struct.Struct('<ddH6x')
+
+
+class TelemetryLog(object):
+    """
+    Logs telemetry samples as fixed size binary records into files in directory without blocking the acquisition
+    threads. record() only packs the sample and puts it into a bounded queue, samples arriving while the queue is full
+    are counted and dropped. A writer thread writes the queued records in batches. A new file is started when the
+    current one exceeds max_size bytes, only the newest keep files are retained if keep is not 0.
+    """
+
+    def __init__(self, directory, signals, max_size=16 * 1024 * 1024, keep=0, queue_size=4096):
+        self._directory = directory
+        self._signals = dict((name, index) for index, name in enumerate(signals))
+        self._names = ','.join(signals).encode('ascii')
+        self._max_size = max_size
+        self._keep = keep
+        self._queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._file = None
+        self._size = 0
+        self._sequence = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._files = sorted(glob.glob(os.path.join(directory, 'telemetry-*.bin')))
+        self._thread = threading.Thread(target=self._write, name='telemetry log')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, name, timestamp, value):
+        try:
+            self._queue.put_nowait(RECORD.pack(timestamp, value, self._signals[name]))
+        except queue.Full:
+            self.dropped += 1
+
+    def _rotate(self):
+        if self._file:
+            self._file.close()
+        prefix = os.path.join(self._directory, time.strftime('telemetry-%Y%m%d-%H%M%S', time.localtime()))
+        path = prefix + '-{:03d}.bin'.format(self._sequence)
+        while os.path.exists(path):
+            self._sequence += 1
+            path = prefix + '-{:03d}.bin'.format(self._sequence)
+        self._sequence += 1
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC + HEADER.pack(len(self._names)) + self._names)
+        self._size = len(MAGIC) + HEADER.size + len(self._names)
+        self._files.append(path)
+        while 0 < self._keep < len(self._files):
+            try:
+                os.remove(self._files.pop(0))
+            except OSError:
+                logging.exception('Failed to remove old telemetry file.')
+
+    def _write(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            batch = []
+            # everything queued meanwhile goes into the same write, None stops the thread
+            while item is not None:
+                batch.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            running = item is not None
+            if not batch:
+                continue
+            try:
+                if self._file is None or self._size >= self._max_size:
+                    self._rotate()
+                self._file.write(b''.join(batch))
+                self._file.flush()
+                self._size += len(batch) * RECORD.size
+                self.written += len(batch)
+            except (IOError, OSError):
+                logging.exception('Writing telemetry failed')
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def stop(self):
+        """
+        Writes the queued records and closes the current file.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def report(self):
+        logging.info('Telemetry log: {:d} samples written, {:d} dropped'.format(self.written, self.dropped))
+
+
+def read(path):
+    """
+    Yields signal name, timestamp and value of every record in the telemetry file at path.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    if content[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a telemetry file: ' + path)
+    offset = len(MAGIC)
+    length, = HEADER.unpack_from(content, offset)
+    offset += HEADER.size
+    names = content[offset:offset + length].decode('ascii').split(',')
+    offset += length
+    # a record cut off by a power loss at the end is ignored
+    for position in range(offset, len(content) - RECORD.size + 1, RECORD.size):
+        timestamp, value, index = RECORD.unpack_from(content, position)
+        yield names[index], timestamp, value
@@ -1,38 +1,290 @@
+import argparse
+import json
+import platform
+import random
+import struct
 import sys
-from threading import Thread
-from time import sleep
+import threading
+import time
+from bmslistener import BMSListener
+from latency import Histogram
+from liveness import Liveness
+from telemetry import Telemetry
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
-alive = True
-i = 0
-j = 0
+# Scheduling delays and GIL hand-offs take microseconds, so the buckets range from 1 microsecond to about 1 second in
+# steps of 2^(1/4).
+BOUNDS = [0.000001 * 2 ** (i / 4.) for i in range(81)]
+# highest resolution clock for the latencies, Python 2 has only time.time()
+clock = getattr(time, 'perf_counter', time.time)
 
 
-def run_i():
-    global i
-    while alive:
-        i += 1
+class NullDisplay(object):
+    def set_voltage(self, value, timestamp=None):
+        pass
 
+    def set_min_cell_address_voltage(self, address, voltage, timestamp=None):
+        pass
 
-def run_j():
-    global j
-    while alive:
-        j += 1
+    def set_charge_level(self, value, timestamp=None):
+        pass
+
+    def set_cells(self, summary, timestamp=None):
+        pass
+
+
+class Worker(object):
+    """
+    One thread of the mix. Counts its operations and records a latency per operation, whose meaning depends on the
+    worker. Every worker defines run(running), which loops while running() returns True.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.latency = Histogram(BOUNDS)
+
+    def threads(self, running):
+        """
+        Returns the threads to start, they loop while running() returns True.
+        """
+        return [threading.Thread(target=self.run, args=(running,), name=self.name)]
+
+    def result(self, elapsed):
+        def milliseconds(value):
+            return None if value is None else value * 1000
+        return {'count': self.count, 'rate': self.count / elapsed, 'latency_ms': {
+            'mean': milliseconds(self.latency.mean()), 'p50': milliseconds(self.latency.percentile(.5)),
+            'p99': milliseconds(self.latency.percentile(.99)),
+            'max': milliseconds(self.latency.maximum) if self.latency.count else None}}
+
+
+class UITick(Worker):
+    """
+    The Kivy Clock: wakes up rate times a second and formats labels. Latency is the delay of the wake up.
+    """
+
+    def __init__(self, rate=20., labels=50):
+        super(UITick, self).__init__('ui')
+        self._period = 1. / rate
+        self._labels = labels
+
+    def run(self, running):
+        deadline = clock()
+        while running():
+            deadline += self._period
+            delay = deadline - clock()
+            if delay > 0:
+                time.sleep(delay)
+            self.latency.record(max(0., clock() - deadline))
+            for i in range(self._labels):
+                '{:3.1f}%'.format(i * 1.7)
+            self.count += 1
+
+
+class Notifier(Worker):
+    """
+    A bus thread sends one cycle of BMS frames at the given frame rate into a queue, the notifier thread decodes them
+    with the BMSListener as python-can does. Latency is the time from sending until decoded.
+    """
+
+    def __init__(self, rate=340., seed=1):
+        super(Notifier, self).__init__('notifier')
+        self._period = 1. / rate
+        self._frames = self.frames(random.Random(seed))
+        self._queue = queue.Queue()
+        self._listener = BMSListener(NullDisplay(), Telemetry(), Liveness())
+
+    @staticmethod
+    def frames(generator):
+        frames = [(0x137, struct.pack('>3H2B', generator.randint(7800, 10650), generator.randint(1, 500), 100, 0,
+                                      0)),
+                  (0x138, struct.pack('>HBH3B', generator.randint(260, 355), 3, generator.randint(260, 355), 17, 0,
+                                      30)),
+                  (0x139, struct.pack('8B', 20, 30, 10, 0, 0, 0, 4, 9)),
+                  (0x13a, struct.pack('>4H', 0, 2000, 600, generator.randint(0, 1000)))]
+        frames += [(0x13b, struct.pack('>BHB', i, generator.randint(260, 355), 25)) for i in range(1, 31)]
+        return frames
+
+    def threads(self, running):
+        return super(Notifier, self).threads(running) + [
+            threading.Thread(target=self.send, args=(running,), name='bus')]
+
+    def send(self, running):
+        deadline = clock()
+        index = 0
+        while running():
+            deadline += self._period
+            delay = deadline - clock()
+            if delay > 0:
+                time.sleep(delay)
+            can_id, data = self._frames[index]
+            index = (index + 1) % len(self._frames)
+            # the listener gets wall clock timestamps like from python-can
+            self._queue.put((can_id, data, time.time(), clock()))
+        self._queue.put(None)
+
+    def run(self, running):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+            can_id, data, timestamp, sent = frame
+            self._listener.process(can_id, data, timestamp)
+            self.latency.record(clock() - sent)
+            self.count += 1
+
+
+class SdoPoller(Worker):
+    """
+    The SDO polling loop: every read waits response seconds for the controller without holding the GIL. Latency is
+    the time the read takes longer than the response.
+    """
+
+    def __init__(self, response=0.002):
+        super(SdoPoller, self).__init__('sdo')
+        self._response = response
+
+    def run(self, running):
+        while running():
+            start = clock()
+            time.sleep(self._response)
+            self.latency.record(max(0., clock() - start - self._response))
+            struct.unpack_from('<h', b'\x10\x27')
+            self.count += 1
+
+
+class HeartbeatMonitor(Worker):
+    """
+    The dispatcher waiting in a queue for heartbeats, which a second thread sends every period seconds. Latency is
+    the time from sending until the dispatcher got it.
+    """
+
+    def __init__(self, period=0.1):
+        super(HeartbeatMonitor, self).__init__('heartbeat')
+        self._period = period
+        self._events = queue.Queue()
+
+    def threads(self, running):
+        return super(HeartbeatMonitor, self).threads(running) + [
+            threading.Thread(target=self.beat, args=(running,), name='controller')]
+
+    def beat(self, running):
+        while running():
+            time.sleep(self._period)
+            self._events.put(clock())
+
+    def run(self, running):
+        while running():
+            try:
+                sent = self._events.get(timeout=self._period * 2)
+            except queue.Empty:
+                continue
+            self.latency.record(clock() - sent)
+            self.count += 1
+
+
+class GilProbe(Worker):
+    """
+    Sleeps one millisecond at a time. Latency is the oversleep, mostly the wait for the GIL after waking up.
+    """
+
+    def __init__(self, sleep=0.001):
+        super(GilProbe, self).__init__('probe')
+        self._sleep = sleep
+
+    def run(self, running):
+        while running():
+            start = clock()
+            time.sleep(self._sleep)
+            self.latency.record(max(0., clock() - start - self._sleep))
+            self.count += 1
+
+
+class Busy(Worker):
+    """
+    Pure Python computation that never releases the GIL on its own, like decoding at a high frame rate. Counts
+    loops of 1000 additions.
+    """
+
+    def __init__(self, name='busy'):
+        super(Busy, self).__init__(name)
+
+    def run(self, running):
+        while running():
+            total = 0
+            for i in range(1000):
+                total += i
+            self.count += 1
+
+
+# name, description and workers of every scenario
+SCENARIOS = (
+    ('idle', 'UI and heartbeat only, the controller is offline',
+     lambda: [UITick(), HeartbeatMonitor(), GilProbe()]),
+    ('sdo', 'SDO polling with BMS frames, the default mode',
+     lambda: [UITick(), Notifier(), SdoPoller(), HeartbeatMonitor(), GilProbe()]),
+    ('pdo', 'TPDOs and BMS frames without SDO polling',
+     lambda: [UITick(), Notifier(360.), HeartbeatMonitor(), GilProbe()]),
+    ('busy-bus', 'unfiltered bus with 5000 frames per second',
+     lambda: [UITick(), Notifier(5000.), SdoPoller(), HeartbeatMonitor(), GilProbe()]),
+    ('cpu-load', 'default mode with a CPU bound thread',
+     lambda: [UITick(), Notifier(), SdoPoller(), HeartbeatMonitor(), GilProbe(), Busy()]),
+)
+
+
+def run(workers, duration):
+    """
+    Runs the workers for duration seconds and returns their results by name.
+    """
+    deadline = clock() + duration
+
+    def running():
+        return clock() < deadline
+
+    threads = [thread for worker in workers for thread in worker.threads(running)]
+    start = clock()
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = clock() - start
+    return dict((worker.name, worker.result(elapsed)) for worker in workers)
 
 
 def main():
-    global alive
-    ti = Thread(target=run_i)
-    tj = Thread(target=run_j)
-    ti.setDaemon(True)
-    tj.setDaemon(True)
-    ti.start()
-    tj.start()
-    sleep(2)
-    alive = False
-    ti.join()
-    tj.join()
-    print('i=%d j=%d' % (i, j))
+    names = [name for name, description, workers in SCENARIOS]
+    parser = argparse.ArgumentParser(description='Thread mix of EWA: throughput and scheduling latency per thread')
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run, default all: ' + ', '.join(names))
+    parser.add_argument('-t', default=5., type=float, help='seconds per scenario')
+    parser.add_argument('-i', type=float, help='GIL switch interval in milliseconds, default the one of Python')
+    parser.add_argument('-o', help='write the results as JSON into this file instead of stdout')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in names:
+            parser.error('unknown scenario ' + name)
+    if args.i and hasattr(sys, 'setswitchinterval'):
+        sys.setswitchinterval(args.i / 1000.)
+    results = {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+               'machine': platform.machine(), 'processors': platform.processor(), 'duration': args.t,
+               'switch_interval_ms': sys.getswitchinterval() * 1000 if hasattr(sys, 'getswitchinterval') else None,
+               'scenarios': {}}
+    for name, description, workers in SCENARIOS:
+        if args.scenarios and name not in args.scenarios:
+            continue
+        sys.stderr.write('{:s}: {:s}\n'.format(name, description))
+        results['scenarios'][name] = run(workers(), args.t)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.o:
+        with open(args.o, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
     return 0
 
 
@@ -1,14 +1,189 @@
-import smbus
+import argparse
+import logging
+import math
+import sys
+import threading
+import time
+import traceback
+from array import array
 
+try:
+    from smbus import SMBus
+except ImportError:
+    SMBus = None
 
-class Throttle:
-    def __init__(self):
-        self.smbus = SMBus()
+# 7 bit address of the force sensor and the register holding the raw value as big endian 16 bit word
+ADDRESS = 0x48
+REGISTER = 0x00
+LENGTH = 2
+# seconds of one byte on a 100kHz I2C bus, 8 data bits and the acknowledge
+BYTE_TIME = 9 / 100000.
+# the sample schedule must not move with the wall clock, the Pi steps it when NTP synchronizes
+clock = getattr(time, 'monotonic', time.time)
 
 
-    def write:
-        smbus.write_i2c_block(address, reg, data)
+class FakeSMBus(object):
+    """
+    Replaces smbus.SMBus without any hardware. Block reads return a slowly oscillating force and take as long as on a
+    100kHz bus: address, register, repeated start with address and the data bytes.
+    """
 
+    def __init__(self, bus=1, period=4.):
+        self._period = period
+        self._start = time.time()
 
-    def read:
-        smbus.read_byte_data(address, reg)
+    def read_i2c_block_data(self, address, register, length):
+        time.sleep((length + 3) * BYTE_TIME)
+        phase = (time.time() - self._start) / self._period * 2 * math.pi
+        value = int(1500 + 1000 * math.sin(phase))
+        return [(value >> 8) & 0xFF, value & 0xFF] + [0] * (length - 2)
+
+    def write_i2c_block_data(self, address, register, data):
+        time.sleep((len(data) + 2) * BYTE_TIME)
+
+    def close(self):
+        pass
+
+
+class Throttle(object):
+    """
+    Samples the force sensor at a fixed rate in its own thread and calls handler(value, timestamp) with every raw
+    value, like the Throttle_Command read from the controller. Every sample is one block read. The sample times follow
+    a fixed schedule, so delays do not accumulate; samples missed by more than a period are skipped. The newest
+    capacity samples are kept in preallocated arrays. An exception of the handler is logged once until the handler
+    succeeds again, sampling goes on.
+    """
+
+    def __init__(self, handler, bus=None, rate=100., address=ADDRESS, register=REGISTER, capacity=1024):
+        if bus is None:
+            if SMBus is None:
+                raise ImportError('smbus is not installed')
+            bus = SMBus(1)
+        self._handler = handler
+        self._bus = bus
+        self._period = 1. / rate
+        self._address = address
+        self._register = register
+        self._capacity = capacity
+        self._timestamps = array('d', [0.]) * capacity
+        self._values = array('i', [0]) * capacity
+        self._next = 0
+        self.samples = 0
+        self.errors = 0
+        self.handler_errors = 0
+        self._handler_failing = False
+        self.skipped = 0
+        self._jitter_sum = 0.
+        self.max_jitter = 0.
+        self._cpu = 0.
+        self._elapsed = 0.
+        self._run = False
+        self._thread = None
+
+    def start(self):
+        self._run = True
+        self._thread = threading.Thread(target=self.sample, name='throttle')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._run = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def read(self):
+        data = self._bus.read_i2c_block_data(self._address, self._register, LENGTH)
+        return (data[0] << 8) | data[1]
+
+    def sample(self):
+        # CPU time of this thread only, Python 3.7 and later
+        thread_time = getattr(time, 'thread_time', None)
+        cpu = thread_time() if thread_time else 0.
+        start = clock()
+        deadline = start
+        while self._run:
+            now = clock()
+            if deadline > now:
+                time.sleep(deadline - now)
+                now = clock()
+            jitter = now - deadline
+            self._jitter_sum += jitter
+            if jitter > self.max_jitter:
+                self.max_jitter = jitter
+            try:
+                value = self.read()
+            except (IOError, OSError):
+                self.errors += 1
+            else:
+                # the samples get wall clock timestamps like received frames
+                timestamp = time.time()
+                position = self._next
+                self._timestamps[position] = timestamp
+                self._values[position] = value
+                self._next = (position + 1) % self._capacity
+                self.samples += 1
+                self.handle(value, timestamp)
+            deadline += self._period
+            now = clock()
+            if deadline + self._period < now:
+                missed = int((now - deadline) / self._period)
+                self.skipped += missed
+                deadline += missed * self._period
+        self._elapsed = clock() - start
+        if thread_time:
+            self._cpu = thread_time() - cpu
+
+    def handle(self, value, timestamp):
+        try:
+            self._handler(value, timestamp)
+        except Exception:
+            self.handler_errors += 1
+            if not self._handler_failing:
+                logging.error(traceback.format_exc())
+            self._handler_failing = True
+        else:
+            self._handler_failing = False
+
+    def history(self):
+        """
+        Returns timestamps and values of the kept samples, the oldest first.
+        """
+        count = min(self.samples, self._capacity)
+        start = (self._next - count) % self._capacity
+        indices = [(start + i) % self._capacity for i in range(count)]
+        return [self._timestamps[i] for i in indices], [self._values[i] for i in indices]
+
+    def statistics(self):
+        attempts = self.samples + self.errors
+        return {'rate': self.samples / self._elapsed if self._elapsed else 0.,
+                'jitter': self._jitter_sum / attempts if attempts else 0., 'max_jitter': self.max_jitter,
+                'cpu': self._cpu / self._elapsed if self._elapsed else 0., 'samples': self.samples,
+                'errors': self.errors, 'handler_errors': self.handler_errors, 'skipped': self.skipped}
+
+    def report(self):
+        values = self.statistics()
+        logging.info('Throttle: target {:.0f}Hz, actual {:.1f}Hz, jitter {:.2f}ms, max {:.2f}ms, CPU {:.1f}%, '
+                     'samples {:d}, errors {:d}, handler errors {:d}, skipped {:d}'.format(
+                         1. / self._period, values['rate'], values['jitter'] * 1000, values['max_jitter'] * 1000,
+                         values['cpu'] * 100, values['samples'], values['errors'], values['handler_errors'],
+                         values['skipped']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Samples the I2C force sensor and reports rate, jitter and CPU use')
+    parser.add_argument('-r', default=100., type=float, help='samples per second')
+    parser.add_argument('-t', default=5., type=float, help='seconds to sample')
+    parser.add_argument('-f', action="store_true", help='use a fake SMBus instead of /dev/i2c-1')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    throttle = Throttle(lambda value, timestamp: None, FakeSMBus() if args.f else None, args.r)
+    throttle.start()
+    time.sleep(args.t)
+    throttle.stop()
+    throttle.report()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())